@@ -11,7 +11,7 @@ import {
 import * as path from 'path'
 import { uIOhook } from 'uiohook-napi'
 import { getConfig, saveConfig } from './config'
-import { disposeLocalRecognizer } from './local-asr'
+import { disposeLocalRecognizer, prewarmLocalRecognizer } from './local-asr'
 import { initLogger, logger } from './logger'
 import { FocusController } from './focus-controller'
 import { closeDb, initDb } from './db'
@@ -31,6 +31,7 @@ import {
   FLOAT_HEIGHT,
   registerProcessErrorHooks,
   attachWebContentsDiagnostics,
+  DEFAULT_LOCAL_MODEL_ID,
 } from './app-context'
 import { checkPermissionsAndGuide, emitPermissionWarning } from './permissions'
 import { registerHotkey } from './hotkeys'
@@ -246,6 +247,12 @@ if (gotSingleInstanceLock) {
     setVadEnabled(Boolean(config.vad?.enabled))
     setupIpc(focusController, setVadEnabledState, updateTrayMenu)
 
+    // 本地模式下先让 sidecar 后台下载/加载模型，与下面的窗口创建、权限检查重叠
+    if ((config.asr?.mode ?? 'api') === 'local') {
+      logger.info(`[Startup] prewarmLocalRecognizer ${ts()}`)
+      void prewarmLocalRecognizer(config.asr?.localModel || DEFAULT_LOCAL_MODEL_ID).catch(() => { })
+    }
+
     logger.info(`[Startup] initRewriteWindow ${ts()}`)
     initRewriteWindow()
     logger.info(`[Startup] createWindow ${ts()}`)
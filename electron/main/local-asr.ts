@@ -38,6 +38,8 @@ let onInitProgress: ((data: { progress: number; status?: string }) => void) | nu
 const SIDECAR_START_TIMEOUT_MS = 45000
 const SIDECAR_STDERR_BUFFER_LIMIT = 80
 const sidecarStderrLines: string[] = []
+// sidecar 默认使用 MessagePack 长度前缀帧；主进程仍走 JSON 行协议，启动时显式声明
+const SIDECAR_WIRE_ARGS = ['--json']
 
 type SidecarErrorPayload = {
   code?: string
@@ -148,13 +150,13 @@ function spawnSidecar(): Promise<void> {
       const devSidecar = path.join(__dirname, `../../dist/sidecar/${platform}/asr_server/asr_server${ext}`)
       if (fs.existsSync(devSidecar)) {
         cmd = devSidecar
-        args = []
+        args = [...SIDECAR_WIRE_ARGS]
       } else {
         const venvPython = process.platform === 'win32'
           ? path.join(__dirname, '../../python/.venv/Scripts/python.exe')
           : path.join(__dirname, '../../python/.venv/bin/python3')
         cmd = fs.existsSync(venvPython) ? venvPython : (process.platform === 'win32' ? 'python' : 'python3')
-        args = [path.join(__dirname, '../../python/asr_server.py')]
+        args = [path.join(__dirname, '../../python/asr_server.py'), ...SIDECAR_WIRE_ARGS]
       }
     } else {
       // 生产模式：使用 PyInstaller 打包的二进制
@@ -164,7 +166,7 @@ function spawnSidecar(): Promise<void> {
       const oneDirExec = path.join(sidecarRoot, `asr_server${ext}`)
       const oneFileExec = path.join(process.resourcesPath, 'sidecar', platform, `asr_server${ext}`)
       cmd = fs.existsSync(oneDirExec) ? oneDirExec : oneFileExec
-      args = []
+      args = [...SIDECAR_WIRE_ARGS]
       if (!fs.existsSync(cmd)) {
         rejectEarly(`sidecar 可执行文件不存在: ${oneDirExec} 或 ${oneFileExec}`)
         return
@@ -310,8 +312,8 @@ function cleanupSidecar() {
   stdoutBuffer = ''
 }
 
-// 向 sidecar 发送请求并等待响应
-function sendRequest(msg: Record<string, any>, timeoutMs = 30000): Promise<any> {
+// 向 sidecar 发送请求并等待响应；payload 以原始字节紧跟在 JSON 头行之后（头中携带 wavBytes）
+function sendRequest(msg: Record<string, any>, timeoutMs = 30000, payload?: Buffer): Promise<any> {
   return new Promise((resolve, reject) => {
     if (!sidecar || !sidecar.stdin?.writable) {
       reject(new Error('sidecar 未启动'))
@@ -333,7 +335,13 @@ function sendRequest(msg: Record<string, any>, timeoutMs = 30000): Promise<any>
       reject: (e) => { clearTimeout(timer); reject(e) },
     })
 
+    if (payload) {
+      msg.wavBytes = payload.byteLength
+    }
     sidecar.stdin!.write(JSON.stringify(msg) + '\n', 'utf-8')
+    if (payload) {
+      sidecar.stdin!.write(payload)
+    }
   })
 }
 
@@ -381,6 +389,35 @@ function buildHotwordsString(modelInfo: ModelInfo): string {
   return content
 }
 
+// init / check / prewarm 共用的模型配置字段
+function buildModelConfig(modelInfo: ModelInfo, puncEnabled: boolean): Record<string, any> {
+  return {
+    modelName: modelInfo.funasrModel,
+    backend: modelInfo.backend,
+    quantize: Boolean(modelInfo.quantized),
+    vadModelName: modelInfo.vadModel,
+    vadBackend: modelInfo.vadBackend,
+    vadQuantize: Boolean(modelInfo.vadQuantized),
+    usePunc: puncEnabled,
+    puncModelName: puncEnabled ? modelInfo.puncModel : '',
+    puncBackend: puncEnabled ? modelInfo.puncBackend : '',
+  }
+}
+
+// 启动早期预加载：sidecar 后台下载并加载模型后立即返回，与窗口创建、权限检查并行；
+// 随后同配置的 init 直接复用已加载的会话
+export async function prewarmLocalRecognizer(modelId: string): Promise<void> {
+  const modelInfo = MODELS.find(m => m.id === modelId)
+  if (!modelInfo || !isHotwordCapableModel(modelInfo)) return
+
+  await spawnSidecar()
+  const resp = await sendRequest({
+    cmd: 'prewarm',
+    ...buildModelConfig(modelInfo, isPuncEnabled()),
+  }, 10000)
+  logger.info(`[ASR] 模型预加载${resp?.started ? '已开始' : '已在进行中'}: ${modelInfo.name}`)
+}
+
 // 初始化或切换本地识别器
 export async function initLocalRecognizer(
   modelId: string,
@@ -418,15 +455,7 @@ export async function initLocalRecognizer(
     const initStart = Date.now()
     const initResp = await sendRequest({
       cmd: 'init',
-      modelName: modelInfo.funasrModel,
-      backend: modelInfo.backend,
-      quantize: Boolean(modelInfo.quantized),
-      vadModelName: modelInfo.vadModel,
-      vadBackend: modelInfo.vadBackend,
-      vadQuantize: Boolean(modelInfo.vadQuantized),
-      usePunc: puncEnabled,
-      puncModelName: puncEnabled ? modelInfo.puncModel : '',
-      puncBackend: puncEnabled ? modelInfo.puncBackend : '',
+      ...buildModelConfig(modelInfo, puncEnabled),
       hotwords,
     }, 600000)
     logger.info(`[ASR] 模型 init 命令耗时: ${Date.now() - initStart}ms`)
@@ -480,10 +509,8 @@ export async function recognizeLocal(wavBuffer: Buffer): Promise<string> {
     throw new Error('本地识别器未初始化，请先选择并下载模型')
   }
 
-  const resp = await sendRequest({
-    cmd: 'recognize',
-    wavBase64: wavBuffer.toString('base64'),
-  }, 120000)
+  // 音频不走 base64：头行声明 wavBytes，随后直接写入 WAV 原始字节
+  const resp = await sendRequest({ cmd: 'recognize' }, 120000, wavBuffer)
 
   if (typeof resp?.segmentCount === 'number') {
     logger.debug(`[ASR] sidecar stats: segmentCount=${resp.segmentCount}, asrPasses=${resp?.asrPasses ?? '?'}`)
@@ -518,15 +545,7 @@ export async function checkModelStatus(modelId: string): Promise<ModelCheckStatu
   try {
     const resp = await sendRequest({
       cmd: 'check',
-      modelName: modelInfo.funasrModel,
-      backend: modelInfo.backend,
-      quantize: Boolean(modelInfo.quantized),
-      vadModelName: modelInfo.vadModel,
-      vadBackend: modelInfo.vadBackend,
-      vadQuantize: Boolean(modelInfo.vadQuantized),
-      usePunc: puncEnabled,
-      puncModelName: puncEnabled ? modelInfo.puncModel : '',
-      puncBackend: puncEnabled ? modelInfo.puncBackend : '',
+      ...buildModelConfig(modelInfo, puncEnabled),
     }, 10000)
     return {
       downloaded: Boolean(resp.downloaded),
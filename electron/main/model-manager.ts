@@ -4,7 +4,8 @@ import * as path from 'path'
 import { getConfig } from './config'
 import { logger } from './logger'
 
-export type AsrBackend = 'funasr_onnx_contextual' | 'funasr_onnx_paraformer'
+// funasr_onnx_contextual_mixed：INT8 主干 + FP32 热词 embedding（精度接近 FP32，延迟接近全 INT8）
+export type AsrBackend = 'funasr_onnx_contextual' | 'funasr_onnx_contextual_mixed' | 'funasr_onnx_paraformer'
 export type HotwordFormat = 'space-separated' | 'none'
 export type VadBackend = 'funasr_onnx_vad'
 export type PuncBackend = 'funasr_onnx_punc'
@@ -84,6 +85,11 @@ function getMissingOnnxFiles(modelDir: string, backend: string, quantize: boolea
     return []
   }
 
+  // 混合精度：INT8 主干 + FP32 热词 embedding，与 quantize 无关
+  if (backend === 'funasr_onnx_contextual_mixed') {
+    return ['model_quant.onnx', 'model_eb.onnx'].filter(name => !fs.existsSync(path.join(modelDir, name)))
+  }
+
   const missing: string[] = []
   if (quantize) {
     if (!fs.existsSync(path.join(modelDir, 'model_quant.onnx'))) {
@@ -1,8 +1,9 @@
 #!/usr/bin/env python3
 """
-ASR Sidecar 进程 — 基于 FunASR，通过 stdin/stdout JSON 协议与 Electron 主进程通信。
+ASR Sidecar 进程 — 基于 FunASR，通过 stdin/stdout 与 Electron 主进程通信。
 
-协议格式（每行一个 JSON）：
+线协议：默认每帧为 4 字节大端长度前缀 + MessagePack 负载；
+启动参数带 --json 时退回每行一个 JSON 的兼容模式。消息结构两种模式一致：
   → {
       "id":1,
       "cmd":"init",
@@ -19,16 +20,52 @@ ASR Sidecar 进程 — 基于 FunASR，通过 stdin/stdout JSON 协议与 Electr
     }
   ← {"id":1, "progress":30}
   ← {"id":1, "ok":true}
+  → {"id":3, "cmd":"prewarm", ...}   # 字段同 init（不含 hotwords）：后台下载并加载模型后立即返回，随后同配置的 init 直接复用
+  ← {"id":3, "ok":true, "started":true}
+  → {"id":2, "cmd":"recognize", "wav":<WAV 原始字节>}       # msgpack 模式
+  → {"id":2, "cmd":"recognize", "wavBytes":N}\n<N 字节 WAV>  # json 模式：头行后紧跟原始字节
+  ← {"id":2, "ok":true, "text":"...", "rawText":"..."}
 """
 
-import base64
+import asyncio
+import contextlib
+import importlib.util
 import inspect
-import json
+import linecache
+import os
 import sys
-
-import numpy as np
-
-from protocol import send_json, error_response, error_from_exception
+import threading
+import traceback
+import weakref
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional
+
+import msgspec
+
+from protocol import (
+    REQUEST_COMMANDS,
+    WIRE_JSON,
+    WIRE_MSGPACK,
+    CheckMsg,
+    DisposeMsg,
+    FdReader,
+    InitMsg,
+    ModelConfigRequest,
+    PingMsg,
+    PrewarmMsg,
+    RecognizeMsg,
+    Request,
+    close_output,
+    decoder,
+    json_decoder,
+    loose_decoder,
+    loose_json_decoder,
+    error_response,
+    error_from_exception,
+    send_msg,
+    set_output_closed_handler,
+    set_wire_format,
+)
 from model_cache import (
     build_dependencies,
     download_model_with_progress,
@@ -37,64 +74,150 @@ from model_cache import (
     cleanup_tmp_files,
     write_hotwords_tmp,
 )
-from model_factory import create_asr_model, create_vad_model, create_punc_model
-from inference import (
-    asr_model, vad_model, punc_model,
-    reset_runtime_models,
-    decode_wav,
-    split_segments_by_vad,
-    run_asr_once,
-    run_punc,
-    inspect_hotword_state_for_model,
+
+
+def _lazy_import(name: str):
+    """模块先登记、首次访问属性时才真正执行。check / ping 用不到推理栈，
+    numpy / onnxruntime 等重依赖随之推迟到首个 init / recognize。"""
+    module = sys.modules.get(name)
+    if module is not None:
+        return module
+    spec = importlib.util.find_spec(name)
+    loader = importlib.util.LazyLoader(spec.loader)
+    spec.loader = loader
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[name] = module
+    loader.exec_module(module)
+    return module
+
+
+inference = _lazy_import("inference")
+model_factory = _lazy_import("model_factory")
+
+
+# recognize 并发线程数（ORT 会话本身线程安全；VAD 有实例状态，在 inference 中单独加锁）。
+# 默认不少于 ASR 微批上限（ASR_MAX_BATCH，与 inference 同一环境变量）：短句连发时同时在途的请求
+# 够多，批处理窗口才能攒满一批；这里直接读环境变量，避免为取常量提前导入推理栈
+RECOGNIZE_WORKERS = max(
+    1,
+    int(os.getenv("ASR_RECOGNIZE_WORKERS", str(max(2, int(os.getenv("ASR_MAX_BATCH", "4")))))),
 )
-import inference
+
+
+def _prime_frozen_linecache():
+    """打包环境中模块源码不在磁盘上：为这类模块登记 linecache 懒加载项，
+    inspect 随后可经模块 loader.get_source 取到源码（若打包时收集了源码）。"""
+    for module in list(sys.modules.values()):
+        filename = getattr(module, "__file__", None)
+        if filename and filename not in linecache.cache and not os.path.exists(filename):
+            linecache.lazycache(filename, module.__dict__)
 
 
 _orig_getsourcelines = inspect.getsourcelines
+# FunASR 注册/构建模型时会反复对同一批对象取源码（打包后常以 OSError 失败），按对象缓存结果
+_sourcelines_cache: "weakref.WeakKeyDictionary" = weakref.WeakKeyDictionary()
 
 
 def _safe_getsourcelines(obj):
     try:
-        return _orig_getsourcelines(obj)
+        return _sourcelines_cache[obj]
+    except (KeyError, TypeError):
+        pass
+    try:
+        result = _orig_getsourcelines(obj)
     except OSError:
-        return ([""], 1)
-
-
-inspect.getsourcelines = _safe_getsourcelines
+        # 之后才导入的模块尚未登记，补登一次再试；仍取不到源码时返回占位
+        _prime_frozen_linecache()
+        try:
+            result = _orig_getsourcelines(obj)
+        except OSError:
+            result = ([""], 1)
+    try:
+        _sourcelines_cache[obj] = result
+    except TypeError:
+        # 不可弱引用的对象不缓存
+        pass
+    return result
+
+
+# 只有打包产物会缺源码；开发环境不包装 inspect
+if getattr(sys, "frozen", False):
+    _prime_frozen_linecache()
+    inspect.getsourcelines = _safe_getsourcelines
+
+
+def _build_dependencies_for(msg: ModelConfigRequest):
+    return build_dependencies(
+        msg.modelName,
+        msg.backend,
+        msg.quantize,
+        msg.vadModelName,
+        msg.vadBackend,
+        msg.vadQuantize,
+        msg.puncModelName if msg.usePunc else "",
+        msg.puncBackend if msg.usePunc else "",
+    )
 
 
-def handle_message(msg: dict) -> dict:
-    cmd = msg.get("cmd")
-    msg_id = msg.get("id", 0)
+# prewarm 后台线程：只下载模型并填充 model_factory 的会话缓存，不切换运行时模型
+_prewarm_thread: Optional[threading.Thread] = None
 
-    if cmd == "init":
-        reset_runtime_models()
-        cleanup_tmp_files()
 
-        model_name = msg["modelName"]
-        backend = msg.get("backend", "funasr_onnx_contextual")
-        quantize = bool(msg.get("quantize", False))
-        hotwords = msg.get("hotwords", "")
-        vad_model_name = msg.get("vadModelName", "")
-        vad_backend = msg.get("vadBackend", "funasr_onnx_vad")
-        vad_quantize = bool(msg.get("vadQuantize", True))
-        use_punc = bool(msg.get("usePunc", True))
-        punc_model_name = msg.get("puncModelName", "") if use_punc else ""
-        punc_backend = msg.get("puncBackend", "funasr_onnx_punc") if use_punc else ""
-
-        dependencies = build_dependencies(
-            model_name,
-            backend,
-            quantize,
-            vad_model_name,
-            vad_backend,
-            vad_quantize,
-            punc_model_name,
-            punc_backend,
+def _prewarm_models(msg: PrewarmMsg):
+    try:
+        dependencies = _build_dependencies_for(msg)
+        if not check_dependencies_downloaded(dependencies):
+            model_factory.clear_model_cache()
+            download_model_with_progress(dependencies, msg.id)
+        quantize, _ = model_factory.resolve_asr_quantize(msg.modelName, msg.backend, msg.quantize)
+        model_factory.create_asr_model(msg.modelName, msg.backend, quantize)
+        model_factory.create_vad_model(msg.vadModelName, msg.vadBackend, msg.vadQuantize)
+        if msg.usePunc:
+            model_factory.create_punc_model(msg.puncModelName, msg.puncBackend)
+    except Exception:
+        # 预加载失败只记日志：随后的 init 会按正常流程重试，并返回结构化错误
+        sys.stderr.write(f"[ASR] 模型预加载失败\n{traceback.format_exc()}")
+        sys.stderr.flush()
+
+
+def handle_message(msg: Request) -> dict:
+    global _prewarm_thread
+    msg_id = msg.id
+
+    if isinstance(msg, PrewarmMsg):
+        if _prewarm_thread is not None and _prewarm_thread.is_alive():
+            return {"id": msg_id, "ok": True, "started": False}
+        _prewarm_thread = threading.Thread(
+            target=_prewarm_models, args=(msg,), name="prewarm", daemon=True
         )
+        _prewarm_thread.start()
+        return {"id": msg_id, "ok": True, "started": True}
+
+    if isinstance(msg, InitMsg):
+        # 预加载尚未完成时先等它结束：同配置的模型随后直接命中会话缓存
+        if _prewarm_thread is not None and _prewarm_thread.is_alive():
+            send_msg({"id": msg_id, "progress": 5, "status": "等待模型预加载..."})
+            _prewarm_thread.join()
+
+        # 不提前清空运行时模型：新模型全部加载成功后才切换，失败时保留上一次可用的配置
+
+        model_name = msg.modelName
+        backend = msg.backend
+        quantize = msg.quantize
+        hotwords = msg.hotwords
+        vad_model_name = msg.vadModelName
+        vad_backend = msg.vadBackend
+        vad_quantize = msg.vadQuantize
+        use_punc = msg.usePunc
+        punc_model_name = msg.puncModelName if use_punc else ""
+        punc_backend = msg.puncBackend if use_punc else ""
+
+        dependencies = _build_dependencies_for(msg)
 
         if not check_dependencies_downloaded(dependencies):
-            send_json({"id": msg_id, "progress": 5, "status": "下载模型..."})
+            send_msg({"id": msg_id, "progress": 5, "status": "下载模型..."})
+            # 模型文件将被（重新）下载，已缓存的会话可能对应旧文件
+            model_factory.clear_model_cache()
             try:
                 download_model_with_progress(dependencies, msg_id)
             except Exception as e:
@@ -106,15 +229,14 @@ def handle_message(msg: dict) -> dict:
                     exc=e,
                 )
 
-        inference.asr_backend = backend
-        inference.asr_hotwords_str = hotwords
-
-        if hotwords:
-            write_hotwords_tmp(hotwords)
-
-        send_json({"id": msg_id, "progress": 92, "status": "加载 ASR 模型..."})
+        send_msg({"id": msg_id, "progress": 92, "status": "加载 ASR 模型..."})
         try:
-            inference.asr_model = create_asr_model(model_name, backend, quantize)
+            quantize, quantize_notice = model_factory.resolve_asr_quantize(model_name, backend, quantize)
+            if quantize_notice:
+                sys.stderr.write(f"[ASR] {quantize_notice}\n")
+                sys.stderr.flush()
+                send_msg({"id": msg_id, "progress": 92, "status": quantize_notice})
+            asr = model_factory.create_asr_model(model_name, backend, quantize)
         except Exception as e:
             return error_from_exception(
                 msg_id=msg_id,
@@ -125,9 +247,12 @@ def handle_message(msg: dict) -> dict:
                 data={"modelName": model_name, "backend": backend, "quantize": quantize},
             )
 
-        send_json({"id": msg_id, "progress": 96, "status": "加载 VAD 模型..."})
+        if model_factory.int8_requant_running():
+            send_msg({"id": msg_id, "progress": 92, "status": "后台生成 S8 量化模型，完成后下次启动生效"})
+
+        send_msg({"id": msg_id, "progress": 96, "status": "加载 VAD 模型..."})
         try:
-            inference.vad_model = create_vad_model(vad_model_name, vad_backend, vad_quantize)
+            vad = model_factory.create_vad_model(vad_model_name, vad_backend, vad_quantize)
         except Exception as e:
             return error_from_exception(
                 msg_id=msg_id,
@@ -142,10 +267,11 @@ def handle_message(msg: dict) -> dict:
                 },
             )
 
+        punc = None
         if use_punc:
-            send_json({"id": msg_id, "progress": 98, "status": "加载 PUNC 模型..."})
+            send_msg({"id": msg_id, "progress": 98, "status": "加载 PUNC 模型..."})
             try:
-                inference.punc_model = create_punc_model(punc_model_name, punc_backend)
+                punc = model_factory.create_punc_model(punc_model_name, punc_backend)
             except Exception as e:
                 return error_from_exception(
                     msg_id=msg_id,
@@ -156,17 +282,29 @@ def handle_message(msg: dict) -> dict:
                     data={"modelName": punc_model_name, "backend": punc_backend},
                 )
         else:
-            inference.punc_model = None
-            send_json({"id": msg_id, "progress": 98, "status": "跳过 PUNC 模型（已关闭）"})
+            send_msg({"id": msg_id, "progress": 98, "status": "跳过 PUNC 模型（已关闭）"})
+
+        inference.asr_model = asr
+        inference.vad_model = vad
+        inference.punc_model = punc
+        inference.asr_backend = backend
+        inference.asr_hotwords_str = hotwords
+        inference.asr_hotwords_norm = inference.normalize_hotwords_for_onnx(hotwords)
+        inference.vad_min_samples = max(0, msg.vadMinSamples)
+        write_hotwords_tmp(hotwords)
+
+        send_msg({"id": msg_id, "progress": 99, "status": "模型预热..."})
+        inference.warmup_models()
+        send_msg({"id": msg_id, "progress": 100, "status": "模型就绪"})
 
-        hotword_stats = inspect_hotword_state_for_model(
+        hotword_stats = inference.inspect_hotword_state_for_model(
             inference.asr_model,
             backend,
             hotwords,
         )
         return {"id": msg_id, "ok": True, "hotwordStats": hotword_stats}
 
-    if cmd == "recognize":
+    if isinstance(msg, RecognizeMsg):
         if inference.asr_model is None:
             return error_response(
                 msg_id=msg_id,
@@ -176,8 +314,15 @@ def handle_message(msg: dict) -> dict:
             )
 
         try:
-            wav_bytes = base64.b64decode(msg["wavBase64"])
-            samples = decode_wav(wav_bytes)
+            # 两种线协议下 wav 均为原始字节；wavBase64 仅兼容旧版客户端
+            wav_bytes = msg.wav
+            if wav_bytes is None:
+                if msg.wavBase64 is None:
+                    raise ValueError("请求缺少 wav / wavBase64 音频数据")
+                import base64
+
+                wav_bytes = base64.b64decode(msg.wavBase64, validate=False)
+            samples = inference.decode_wav(memoryview(wav_bytes))
         except Exception as e:
             return error_from_exception(
                 msg_id=msg_id,
@@ -185,9 +330,11 @@ def handle_message(msg: dict) -> dict:
                 message="音频解码失败",
                 phase="recognize/decode",
                 exc=e,
+                # decode_wav 对格式问题抛 ValueError，调用栈没有排查价值
+                with_traceback=not isinstance(e, ValueError),
             )
 
-        if not isinstance(samples, np.ndarray) or samples.size == 0:
+        if inference.is_silent(samples):
             return {
                 "id": msg_id,
                 "ok": True,
@@ -198,7 +345,7 @@ def handle_message(msg: dict) -> dict:
             }
 
         try:
-            segments = split_segments_by_vad(samples)
+            segments = inference.split_segments_by_vad(samples)
         except Exception as e:
             return error_from_exception(
                 msg_id=msg_id,
@@ -208,18 +355,12 @@ def handle_message(msg: dict) -> dict:
                 exc=e,
             )
 
-        merged = None
-        if len(segments) <= 1:
-            merged = segments[0] if segments else samples
-        else:
-            valid_segments = [seg for seg in segments if isinstance(seg, np.ndarray) and seg.size > 0]
-            if valid_segments:
-                merged = np.concatenate(valid_segments)
-            else:
-                merged = samples
+        # segments 为 (start, end) 采样下标；连续区间直接取视图，不连续才拷贝拼接
+        merged = inference.merge_segments(samples, segments) if segments else samples
 
         try:
-            raw_text = run_asr_once(merged).strip()
+            raw_text, asr_passes = inference.run_asr(merged)
+            raw_text = raw_text.strip()
         except Exception as e:
             return error_from_exception(
                 msg_id=msg_id,
@@ -229,7 +370,7 @@ def handle_message(msg: dict) -> dict:
                 exc=e,
             )
         try:
-            text = run_punc(raw_text)
+            text = inference.run_punc(raw_text)
         except Exception as e:
             return error_from_exception(
                 msg_id=msg_id,
@@ -245,31 +386,17 @@ def handle_message(msg: dict) -> dict:
             "text": text,
             "rawText": raw_text,
             "segmentCount": len(segments),
-            "asrPasses": 1,
+            "asrPasses": asr_passes,
         }
 
-    if cmd == "check":
-        model_name = msg["modelName"]
-        backend = msg.get("backend", "funasr_onnx_contextual")
-        quantize = bool(msg.get("quantize", False))
-        vad_model_name = msg.get("vadModelName", "")
-        vad_backend = msg.get("vadBackend", "funasr_onnx_vad")
-        vad_quantize = bool(msg.get("vadQuantize", True))
-        use_punc = bool(msg.get("usePunc", True))
-        punc_model_name = msg.get("puncModelName", "") if use_punc else ""
-        punc_backend = msg.get("puncBackend", "funasr_onnx_punc") if use_punc else ""
-
-        dependencies = build_dependencies(
-            model_name,
-            backend,
-            quantize,
-            vad_model_name,
-            vad_backend,
-            vad_quantize,
-            punc_model_name,
-            punc_backend,
-        )
-        dependency_status = [inspect_dependency(dep) for dep in dependencies]
+    if isinstance(msg, CheckMsg):
+        dependencies = _build_dependencies_for(msg)
+        # 各依赖的文件系统探测互不相关（杀软扫描下单次可达上百毫秒），并发执行
+        if len(dependencies) > 1:
+            with ThreadPoolExecutor(max_workers=len(dependencies)) as pool:
+                dependency_status = list(pool.map(inspect_dependency, dependencies))
+        else:
+            dependency_status = [inspect_dependency(dep) for dep in dependencies]
         downloaded = all(item.get("complete") for item in dependency_status)
         asr_cached = any(
             item.get("role") == "ASR" and item.get("cached")
@@ -284,60 +411,196 @@ def handle_message(msg: dict) -> dict:
             "dependencies": dependency_status,
         }
 
-    if cmd == "dispose":
-        reset_runtime_models()
+    if isinstance(msg, DisposeMsg):
+        # 预加载可能仍在使用兼容目录，结束后再清理
+        if _prewarm_thread is not None:
+            _prewarm_thread.join()
+        inference.reset_runtime_models()
         cleanup_tmp_files()
         return {"id": msg_id, "ok": True}
 
-    if cmd == "ping":
+    if isinstance(msg, PingMsg):
         return {"id": msg_id, "ok": True}
 
     return error_response(
         msg_id=msg_id,
         code="UNKNOWN_COMMAND",
-        message=f"未知命令: {cmd}",
+        message=f"未知命令: {type(msg).__name__}",
         phase="router",
     )
 
 
-def main():
-    # Windows 默认 stdin/stdout 编码为系统 locale（如 GBK），强制 UTF-8 避免中文乱码
-    sys.stdin.reconfigure(encoding="utf-8")
-    sys.stdout.reconfigure(encoding="utf-8", line_buffering=True)
-    sys.stderr.reconfigure(encoding="utf-8", line_buffering=True)
-    send_json({"ready": True})
-
-    for line in sys.stdin:
-        line = line.strip()
-        if not line:
+def dispatch(msg: Request) -> dict:
+    try:
+        return handle_message(msg)
+    except Exception as e:
+        return error_from_exception(
+            msg_id=msg.id,
+            code="INTERNAL_ERROR",
+            message="sidecar 内部异常",
+            phase="dispatch",
+            exc=e,
+        )
+
+
+def invalid_request_response(raw: bytes, loose_decode, exc: Exception, fmt_name: str, data) -> dict:
+    """类型化解码失败时，尽量按原始 id 回错：未知命令 → UNKNOWN_COMMAND，字段错误 → INVALID_REQUEST。"""
+    try:
+        loose = loose_decode(raw)
+    except msgspec.DecodeError:
+        loose = None
+    if not isinstance(loose, dict):
+        return error_from_exception(
+            msg_id=0,
+            code="PARSE_ERROR",
+            message=f"请求 {fmt_name} 解析失败",
+            phase="parse",
+            exc=exc,
+            data=data,
+            with_traceback=False,
+        )
+    msg_id = loose.get("id") if isinstance(loose.get("id"), int) else 0
+    cmd = loose.get("cmd")
+    if cmd not in REQUEST_COMMANDS:
+        return error_response(
+            msg_id=msg_id,
+            code="UNKNOWN_COMMAND",
+            message=f"未知命令: {cmd}",
+            phase="router",
+        )
+    return error_from_exception(
+        msg_id=msg_id,
+        code="INVALID_REQUEST",
+        message=f"请求字段校验失败({cmd})",
+        phase="parse",
+        exc=exc,
+        data=data,
+        with_traceback=False,
+    )
+
+
+def iter_json_messages(reader: FdReader):
+    """逐行读取 JSON 请求，产出 (msg, None) 或解析失败时的 (None, error)。"""
+    # 直接读 fd 切行，跳过 TextIOWrapper 解码与缓冲层
+    while (line := reader.read_line()) is not None:
+        # msgspec 自身容忍首尾空白（含 \r），不必 strip 复制整行
+        if not line or line.isspace():
             continue
-        msg = None
         try:
-            msg = json.loads(line)
-        except json.JSONDecodeError as e:
-            resp = error_from_exception(
-                msg_id=0,
-                code="PARSE_ERROR",
-                message="请求 JSON 解析失败",
-                phase="parse",
-                exc=e,
-                data={"linePreview": line[:200]},
+            msg = json_decoder.decode(line)
+        except msgspec.DecodeError as e:
+            # 头行校验失败也要吞掉其后的原始负载，否则后续请求错位
+            _skip_declared_payload(reader, line)
+            preview = line[:200].decode("utf-8", errors="replace")
+            yield None, invalid_request_response(
+                line, loose_json_decoder.decode, e, "JSON", {"linePreview": preview}
             )
-            send_json(resp)
             continue
+        if isinstance(msg, RecognizeMsg) and msg.wavBytes > 0:
+            msg.wav = reader.read_exact(msg.wavBytes)
+            if msg.wav is None:
+                break
+        yield msg, None
 
+
+def _skip_declared_payload(reader: FdReader, line: bytes):
+    try:
+        loose = loose_json_decoder.decode(line)
+    except msgspec.DecodeError:
+        return
+    size = loose.get("wavBytes") if isinstance(loose, dict) else None
+    if isinstance(size, int) and size > 0:
+        reader.read_exact(size)
+
+
+def iter_msgpack_messages(reader: FdReader):
+    """逐帧读取 MessagePack 请求，产出 (msg, None) 或解析失败时的 (None, error)。"""
+    while (frame := reader.read_frame()) is not None:
         try:
-            resp = handle_message(msg)
-        except Exception as e:
-            safe_id = msg.get("id", 0) if isinstance(msg, dict) else 0
-            resp = error_from_exception(
-                msg_id=safe_id,
-                code="INTERNAL_ERROR",
-                message="sidecar 内部异常",
-                phase="dispatch",
-                exc=e,
+            yield decoder.decode(frame), None
+        except msgspec.DecodeError as e:
+            yield None, invalid_request_response(
+                frame, loose_decoder.decode, e, "MessagePack", {"frameBytes": len(frame)}
             )
-        send_json(resp)
+
+
+async def serve(messages, reader: Optional[FdReader] = None):
+    """请求调度：recognize 提交到线程池并发执行；其余命令彼此串行，init/dispose 另需等在途识别全部完成。"""
+    loop = asyncio.get_running_loop()
+    queue: asyncio.Queue = asyncio.Queue()
+
+    def enqueue(batch):
+        for item in batch:
+            queue.put_nowait(item)
+
+    # stdin 由独立线程阻塞读取再投递到事件循环：Windows 上子进程的匿名管道
+    # 不支持 overlapped IO，也不能用 select，无法直接用 loop.connect_read_pipe。
+    # 同一次 os.read 读到的多条请求攒成一批投递，事件循环只被唤醒一次
+    def pump():
+        batch = []
+        for item in messages:
+            batch.append(item)
+            if reader is None or not reader.buffered():
+                loop.call_soon_threadsafe(enqueue, batch)
+                batch = []
+        batch.append(None)
+        loop.call_soon_threadsafe(enqueue, batch)
+
+    threading.Thread(target=pump, name="stdin-reader", daemon=True).start()
+
+    def on_output_closed():
+        # 响应已无处可写：与 stdin EOF 一样结束请求循环（事件循环已关闭时忽略）
+        with contextlib.suppress(RuntimeError):
+            loop.call_soon_threadsafe(enqueue, [None])
+
+    set_output_closed_handler(on_output_closed)
+
+    inflight: set[asyncio.Task] = set()
+
+    async def run_recognize(pool, msg):
+        send_msg(await loop.run_in_executor(pool, dispatch, msg))
+
+    with ThreadPoolExecutor(
+        max_workers=RECOGNIZE_WORKERS, thread_name_prefix="recognize"
+    ) as pool:
+        while True:
+            item = await queue.get()
+            if item is None:
+                break
+            msg, err = item
+            if err is not None:
+                send_msg(err)
+                continue
+            if isinstance(msg, RecognizeMsg):
+                task = loop.create_task(run_recognize(pool, msg))
+                inflight.add(task)
+                task.add_done_callback(inflight.discard)
+                continue
+            # init/dispose 会替换模型引用，必须等在途识别结束后再执行；
+            # check/ping 不碰运行时模型，不必排在长识别之后
+            if inflight and isinstance(msg, (InitMsg, DisposeMsg)):
+                await asyncio.gather(*inflight)
+            send_msg(await loop.run_in_executor(None, dispatch, msg))
+        if inflight:
+            await asyncio.gather(*inflight)
+
+
+def main():
+    # --json: 兼容旧版 Electron 端的 JSON 行协议（迁移期间保留）
+    use_json = "--json" in sys.argv[1:]
+    # Windows 默认 stderr 编码为系统 locale（如 GBK），强制 UTF-8 避免中文乱码；
+    # 协议输入输出都直接走 stdin/stdout 二进制缓冲，按 UTF-8 编解码，不经过文本层
+    sys.stderr.reconfigure(encoding="utf-8")
+    set_wire_format(WIRE_JSON if use_json else WIRE_MSGPACK)
+    send_msg({"ready": True})
+
+    reader = FdReader(sys.stdin.fileno())
+    messages = iter_json_messages(reader) if use_json else iter_msgpack_messages(reader)
+    try:
+        asyncio.run(serve(messages, reader))
+    finally:
+        # 最后几条响应可能仍在写线程队列中
+        close_output()
 
 
 if __name__ == "__main__":
@@ -6,6 +6,7 @@ PyInstaller 打包脚本 — 将 asr_server.py 打包为平台特定目录版(si
 输出：dist/sidecar/{mac|win|linux}/asr_server/asr_server[.exe]
 """
 
+import os
 import platform
 import shutil
 import subprocess
@@ -22,10 +23,17 @@ EXCLUDED_MODULES = [
     "tensorboard",
 ]
 HIDDEN_IMPORTS: list[str] = [
+    # asr_server 延迟导入推理模块，静态分析看不到
+    "inference",
+    "model_factory",
     "funasr_onnx.paraformer_bin",
     "funasr_onnx.vad_bin",
     "funasr_onnx.punc_bin",
 ]
+# 纯 Python 热点模块：构建环境装有 mypy 时用 mypyc 预编译为 C 扩展，替换源码打包
+MYPYC_MODULES = [
+    "inference_text",
+]
 EXCLUDED_TOP_LEVEL_DIRS = [
     "torch",
     "torchaudio",
@@ -50,49 +58,27 @@ def get_platform_name() -> str:
         return "linux"
 
 
-def patch_funasr_onnx_numpy2() -> None:
-    """修补 funasr_onnx/vad_bin.py 以兼容 numpy 2.x。
-    numpy 2.x 不再允许对 1 维数组调用 int()，需要先用 .item() 转为标量。
-    """
-    # 直接通过 site-packages 路径定位，避免触发 funasr_onnx 的 import（会拉 torch）
-    import site
-    # 优先检查项目 venv
-    venv_sp = ROOT / "python" / ".venv" / "Lib" / "site-packages" / "funasr_onnx" / "vad_bin.py"
-    candidates_paths = [venv_sp] + [Path(sp) / "funasr_onnx" / "vad_bin.py" for sp in site.getsitepackages() + [site.getusersitepackages()]]
-    vad_file = None
-    for p in candidates_paths:
-        if p.exists():
-            vad_file = p
-            break
-    if vad_file is None:
-        print("跳过 patch: 未找到 funasr_onnx/vad_bin.py")
-        return
-    src = vad_file.read_text(encoding="utf-8")
-
-    # 已经 patch 过则跳过
-    marker = "# [patched] numpy2 compat"
-    if marker in src:
-        print(f"vad_bin.py 已 patch，跳过: {vad_file}")
-        return
-
-    # 在 feats, feats_len = self.extract_feat(waveform) 后面插入标量转换
-    old = "            feats, feats_len = self.extract_feat(waveform)"
-    new = (
-        "            feats, feats_len = self.extract_feat(waveform)\n"
-        "            feats_len = int(feats_len.flat[0])  " + marker
-    )
-    if old not in src:
-        print(f"警告: vad_bin.py 结构不匹配，跳过 patch: {vad_file}")
-        return
-
-    patched = src.replace(old, new, 1)
-    # feats_len 已是 int，.max() 无意义，直接替换
-    patched = patched.replace(
-        "step = int(min(feats_len.max(), 6000))",
-        "step = min(feats_len, 6000)  " + marker,
-    )
-    vad_file.write_text(patched, encoding="utf-8")
-    print(f"已 patch vad_bin.py (numpy2 兼容): {vad_file}")
+def compile_mypyc_modules(python_exe: str) -> list[Path]:
+    """用 mypyc 编译 MYPYC_MODULES，返回生成的扩展模块路径；venv 未安装 mypy 时跳过，按纯 Python 打包。"""
+    probe = subprocess.run([python_exe, "-c", "import mypyc"], capture_output=True)
+    if probe.returncode != 0:
+        print("跳过 mypyc 编译: venv 未安装 mypy（pip install mypy 后可启用）")
+        return []
+    build_dir = ROOT / "build" / "mypyc"
+    build_dir.mkdir(parents=True, exist_ok=True)
+    sources = [str(ROOT / "python" / f"{name}.py") for name in MYPYC_MODULES]
+    # mypyc 以当前目录为输出位置（build_ext --inplace）
+    try:
+        subprocess.run([python_exe, "-m", "mypyc", *sources], cwd=build_dir, check=True)
+    except subprocess.CalledProcessError as e:
+        # 常见于缺少 C 编译器（如 Windows 未装 MSVC 生成工具），退回纯 Python
+        print(f"警告: mypyc 编译失败，按纯 Python 打包: {e}")
+        return []
+    suffix = ".pyd" if platform.system().lower() == "windows" else ".so"
+    built = [path for name in MYPYC_MODULES for path in build_dir.glob(f"{name}.*{suffix}")]
+    for path in built:
+        print(f"mypyc 已编译: {path}")
+    return built
 
 
 def cleanup_excluded_artifacts(sidecar_dir: Path) -> None:
@@ -142,13 +128,12 @@ def main():
     print(f"打包平台: {plat}")
     print(f"输出目录: {out_dir}")
 
-    # 打包前修补 funasr_onnx 以兼容 numpy 2.x
-    patch_funasr_onnx_numpy2()
-
     # 确保 venv 存在并使用它的 Python 构建
     python_exe = str(ensure_venv())
     print(f"使用 Python: {python_exe}")
 
+    compiled = compile_mypyc_modules(python_exe)
+
     cmd = [
         python_exe, "-m", "PyInstaller",
         "--onedir",
@@ -163,6 +148,10 @@ def main():
         cmd.extend(["--hidden-import", module])
     for module in EXCLUDED_MODULES:
         cmd.extend(["--exclude-module", module])
+    # 编译产物以二进制放在 _internal 根目录；排除同名源码，确保导入时加载的是扩展模块
+    for path in compiled:
+        cmd.extend(["--add-binary", f"{path}{os.pathsep}."])
+        cmd.extend(["--exclude-module", path.name.split(".", 1)[0]])
     cmd.append(str(SCRIPT))
 
     print(f"执行: {' '.join(cmd)}")
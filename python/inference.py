@@ -1,7 +1,19 @@
 """推理运行时 — ASR / VAD / PUNC 推理 + 文本归一化。"""
 
+import os
+import queue
+import struct
+import threading
+import time
+from concurrent.futures import Future
+from dataclasses import dataclass
+from typing import Optional
+
 import numpy as np
 
+from inference_fast import pcm16_to_f32, warmup_kernels
+from inference_text import _extract_hotwords, normalize_hotwords_for_onnx, normalize_result_text
+
 
 # ── 运行时模型状态 ──
 
@@ -9,54 +21,41 @@ asr_model = None
 vad_model = None
 punc_model = None
 asr_backend = "funasr_onnx_contextual"
+# 支持热词的 ContextualParaformer 后端（mixed：INT8 主干 + FP32 热词 embedding）
+CONTEXTUAL_BACKENDS = ("funasr_onnx_contextual", "funasr_onnx_contextual_mixed")
 asr_hotwords_str = ""
+# init 时预先归一化的 ONNX 热词串，识别热路径直接使用
+asr_hotwords_norm = "。"
+
+
+# 每线程复用的 float32 暂存缓冲（按名称区分用途），避免每次识别都重新分配
+_scratch = threading.local()
+_vad_lock = threading.Lock()
+
+
+def _scratch_view(name: str, n: int) -> np.ndarray:
+    """返回复用缓冲前 n 个元素的视图，容量不足时按倍数扩容。
+    视图仅在当前请求内有效，下次同名调用会覆盖其内容。"""
+    buf = getattr(_scratch, name, None)
+    if buf is None or buf.size < n:
+        grow = 2 * buf.size if buf is not None else 0
+        buf = np.empty(max(n, grow), dtype=np.float32)
+        setattr(_scratch, name, buf)
+    return buf[:n]
 
 
 def reset_runtime_models():
-    global asr_model, vad_model, punc_model, asr_backend, asr_hotwords_str
+    """只解除当前引用；已加载的会话仍留在 model_factory 的进程级缓存中。"""
+    global asr_model, vad_model, punc_model, asr_backend, asr_hotwords_str, asr_hotwords_norm
     asr_model = None
     vad_model = None
     punc_model = None
     asr_backend = "funasr_onnx_contextual"
     asr_hotwords_str = ""
+    asr_hotwords_norm = "。"
 
 
-# ── 文本归一化 ──
-
-def _extract_hotwords(hotwords: str) -> list[str]:
-    words: list[str] = []
-    seen: set[str] = set()
-    lines = hotwords.splitlines()
-
-    for line in lines:
-        tokens = line.strip().split()
-        if not tokens:
-            continue
-
-        if len(tokens) >= 2 and tokens[1].replace(".", "", 1).isdigit():
-            token_iter = [tokens[0]]
-        else:
-            token_iter = tokens
-
-        for word in token_iter:
-            if word and word not in seen:
-                seen.add(word)
-                words.append(word)
-
-    if not words:
-        for word in hotwords.strip().split():
-            if word and word not in seen:
-                seen.add(word)
-                words.append(word)
-    return words
-
-
-def normalize_hotwords_for_onnx(hotwords: str) -> str:
-    words = _extract_hotwords(hotwords)
-    if not words:
-        words.append("。")
-    return " ".join(words)
-
+# ── 热词状态 ──
 
 def inspect_hotword_state_for_model(model, backend: str, hotwords: str) -> dict:
     configured_words = _extract_hotwords(hotwords)
@@ -68,7 +67,7 @@ def inspect_hotword_state_for_model(model, backend: str, hotwords: str) -> dict:
         "mode": "backend-pass-through",
     }
 
-    if backend != "funasr_onnx_contextual":
+    if backend not in CONTEXTUAL_BACKENDS:
         return stats
 
     normalized = normalize_hotwords_for_onnx(hotwords)
@@ -91,110 +90,231 @@ def inspect_hotword_state_for_model(model, backend: str, hotwords: str) -> dict:
     return stats
 
 
-def normalize_result_text(value) -> str:
-    if value is None:
-        return ""
-    if isinstance(value, str):
-        return value
-    if isinstance(value, (int, float, bool)):
-        return str(value)
-    if isinstance(value, (list, tuple)):
-        if (
-            len(value) >= 2
-            and isinstance(value[0], str)
-            and any(not isinstance(item, str) for item in value[1:])
-        ):
-            first = value[0].strip()
-            if first:
-                return first
-        parts = [normalize_result_text(item) for item in value]
-        parts = [part for part in parts if part]
-        return "".join(parts)
-    if isinstance(value, dict):
-        for key in ("text", "preds", "pred", "sentence", "transcript"):
-            if key in value:
-                normalized = normalize_result_text(value.get(key))
-                if normalized:
-                    return normalized
-        return ""
-    return str(value)
-
-
-def decode_wav(wav_bytes: bytes) -> np.ndarray:
-    if not wav_bytes or len(wav_bytes) <= 44:
+WAVE_FORMAT_PCM = 1
+WAVE_FORMAT_IEEE_FLOAT = 3
+WAVE_FORMAT_EXTENSIBLE = 0xFFFE
+MODEL_SAMPLE_RATE = 16000
+
+_CHUNK_HEADER = struct.Struct("<4sI")
+# fmt 块固定部分：format_tag, channels, sample_rate, byte_rate, block_align, bits_per_sample
+_FMT_CHUNK = struct.Struct("<HHIIHH")
+
+
+@dataclass(frozen=True)
+class WavLayout:
+    data_offset: int
+    data_length: int
+    format_tag: int
+    channels: int
+    sample_rate: int
+    bits: int
+
+
+def _parse_wav_header(mv: memoryview) -> WavLayout:
+    """遍历 RIFF 子块，解析 fmt 并定位 data 块。"""
+    if mv.nbytes < 12 or mv[0:4] != b"RIFF" or mv[8:12] != b"WAVE":
+        raise ValueError("不是有效的 RIFF/WAVE 音频")
+    fmt = (0, 1, MODEL_SAMPLE_RATE, 0, 0, 0)
+    pos = 12
+    while pos + _CHUNK_HEADER.size <= mv.nbytes:
+        chunk_id, size = _CHUNK_HEADER.unpack_from(mv, pos)
+        body = pos + _CHUNK_HEADER.size
+        if chunk_id == b"fmt " and size >= _FMT_CHUNK.size:
+            fmt = _FMT_CHUNK.unpack_from(mv, body)
+            if fmt[0] == WAVE_FORMAT_EXTENSIBLE and size >= 26:
+                # 子格式 GUID 的前两个字节即实际 format_tag
+                fmt = (struct.unpack_from("<H", mv, body + 24)[0],) + fmt[1:]
+        elif chunk_id == b"data":
+            # 流式写入的 WAV 可能 size 为 0 / 0xFFFFFFFF，按实际剩余长度截断
+            length = mv.nbytes - body
+            if 0 < size < length:
+                length = size
+            format_tag, channels, sample_rate, _, _, bits = fmt
+            return WavLayout(body, length, format_tag, max(1, channels), sample_rate, bits)
+        pos = body + size + (size & 1)
+    raise ValueError("WAV 缺少 data 块")
+
+
+def _downmix(samples: np.ndarray, channels: int) -> np.ndarray:
+    frames = samples.size // channels
+    return samples[:frames * channels].reshape(frames, channels).mean(axis=1, dtype=np.float32)
+
+
+def decode_wav(wav_bytes) -> np.ndarray:
+    """解码 16 kHz WAV 为 float32 单声道样本。支持 16-bit PCM 与 32-bit float，多声道取均值；
+    接受 bytes / memoryview，PCM 段直接按偏移映射不做切片拷贝。"""
+    if wav_bytes is None:
         return np.array([], dtype=np.float32)
-    pcm = wav_bytes[44:]
-    if not pcm:
+    mv = memoryview(wav_bytes)
+    if mv.nbytes <= 44:
         return np.array([], dtype=np.float32)
-    samples = np.frombuffer(pcm, dtype=np.int16).astype(np.float32) / 32768.0
+    wav = _parse_wav_header(mv)
+    if wav.sample_rate != MODEL_SAMPLE_RATE:
+        raise ValueError(f"不支持的采样率: {wav.sample_rate}（需要 {MODEL_SAMPLE_RATE}）")
+    if wav.format_tag == WAVE_FORMAT_PCM and wav.bits == 16:
+        pcm = np.frombuffer(mv, dtype=np.int16, count=wav.data_length // 2, offset=wav.data_offset)
+        samples = pcm16_to_f32(pcm, _scratch_view("decode", pcm.size))
+    elif wav.format_tag == WAVE_FORMAT_IEEE_FLOAT and wav.bits == 32:
+        samples = np.frombuffer(
+            mv, dtype=np.float32, count=wav.data_length // 4, offset=wav.data_offset
+        )
+        if wav.data_offset % 4 != 0:
+            out = _scratch_view("decode", samples.size)
+            np.copyto(out, samples)
+            samples = out
+        # 否则已是模型输入格式，零拷贝直通
+    else:
+        raise ValueError(f"不支持的 WAV 格式: format_tag={wav.format_tag}, bits={wav.bits}")
+    if wav.channels > 1:
+        samples = _downmix(samples, wav.channels)
     return samples
 
 
 # ── VAD 分段 ──
 
+# 短于该长度（默认 1.5s）的音频几乎整段都是语音，跳过 VAD 直接整段识别；init 可通过 vadMinSamples 调整
+vad_min_samples = 24000
+
+# 低于 100ms 或均方能量近零（麦克风异常产生的静音缓冲）的音频直接视为无语音
+MIN_SPEECH_SAMPLES = 1600
+SILENCE_MEAN_SQUARE = 1e-6
+
+
+def is_silent(samples: np.ndarray) -> bool:
+    """VAD/ASR 之前的能量预检：一次 BLAS sdot，远比模型前向便宜。"""
+    if samples.size < MIN_SPEECH_SAMPLES:
+        return True
+    mean_square = float(np.dot(samples, samples)) / samples.size
+    return mean_square < SILENCE_MEAN_SQUARE
+
+
 def _extract_vad_pairs(node, pairs):
-    if isinstance(node, (list, tuple)):
+    """深度优先收集嵌套 VAD 输出中的 [start, end] 数值对（显式栈，顺序与递归遍历一致）。"""
+    stack = [node]
+    while stack:
+        node = stack.pop()
+        if not isinstance(node, (list, tuple)):
+            continue
         if (
             len(node) == 2
             and isinstance(node[0], (int, float))
             and isinstance(node[1], (int, float))
         ):
             pairs.append((float(node[0]), float(node[1])))
-            return
-        for item in node:
-            _extract_vad_pairs(item, pairs)
+            continue
+        # 逆序压栈，保证按原顺序出栈（去重时保留首次出现的原值）
+        stack.extend(reversed(node))
+
 
+def _vad_pairs_array(vad_output) -> Optional[np.ndarray]:
+    """FSMN VAD 常规输出 [[[start_ms, end_ms], ...]] 一次转为 (N, 2) 数组；形状不符返回 None。"""
+    if not (isinstance(vad_output, list) and len(vad_output) == 1):
+        return None
+    item = vad_output[0]
+    if not (isinstance(item, list) and item):
+        return None
+    try:
+        arr = np.asarray(item, dtype=np.float64)
+    except (TypeError, ValueError):
+        return None
+    if arr.ndim != 2 or arr.shape[1] != 2:
+        return None
+    return arr
 
-def split_segments_by_vad(samples: np.ndarray):
+
+def split_segments_by_vad(samples: np.ndarray) -> list[tuple[int, int]]:
+    """返回 VAD 语音段的 (start, end) 采样下标，不做任何切片或拷贝。"""
     if not isinstance(samples, np.ndarray) or samples.size == 0:
         return []
-    if vad_model is None:
-        return [samples]
+    whole = [(0, int(samples.size))]
+    if vad_model is None or samples.size < vad_min_samples:
+        return whole
     try:
-        vad_output = vad_model(samples)
+        # funasr_onnx Fsmn_vad 每次调用都会重建实例上的打分器状态，不可并发
+        with _vad_lock:
+            vad_output = vad_model(samples)
     except Exception as e:
         raise RuntimeError("VAD 推理失败") from e
 
-    pairs: list[tuple[float, float]] = []
-    _extract_vad_pairs(vad_output, pairs)
-    if not pairs:
-        return [samples]
-
-    deduped: list[tuple[float, float]] = []
-    seen: set[tuple[int, int]] = set()
-    for start_ms, end_ms in pairs:
-        key = (int(round(float(start_ms))), int(round(float(end_ms))))
-        if key in seen:
-            continue
-        seen.add(key)
-        deduped.append((float(start_ms), float(end_ms)))
-    deduped.sort(key=lambda item: (item[0], item[1]))
-
-    segmented = []
-    total = len(samples)
-    for start_ms, end_ms in deduped:
-        start = max(0, int(start_ms * 16))
-        end = min(total, int(end_ms * 16))
-        if end <= start:
-            continue
-        if end - start < 320:
-            continue
-        segmented.append(samples[start:end])
+    arr = _vad_pairs_array(vad_output)
+    if arr is None:
+        pairs: list[tuple[float, float]] = []
+        _extract_vad_pairs(vad_output, pairs)
+        if not pairs:
+            return whole
+        arr = np.asarray(pairs, dtype=np.float64)
+
+    # 按取整后的 (start, end) 去重（保留首次出现的原值），再按 (start, end) 排序
+    _, first = np.unique(np.rint(arr).astype(np.int64), axis=0, return_index=True)
+    arr = arr[np.sort(first)]
+    arr = arr[np.lexsort((arr[:, 1], arr[:, 0]))]
+
+    total = samples.size
+    starts = np.maximum((arr[:, 0] * 16).astype(np.intp), 0)
+    ends = np.minimum((arr[:, 1] * 16).astype(np.intp), total)
+    keep = ends - starts >= 320
+    segmented = list(zip(starts[keep].tolist(), ends[keep].tolist()))
+    return segmented or whole
+
+
+def merge_segments(samples: np.ndarray, segments) -> np.ndarray:
+    """按 (start, end) 边界拼接各段（去掉段间静音）。
+    首尾相接的段先合并为连续区间；只剩一个区间时直接返回视图，否则拷贝到复用缓冲。"""
+    runs: list[list[int]] = []
+    for start, end in segments:
+        if runs and runs[-1][1] == start:
+            runs[-1][1] = end
+        else:
+            runs.append([start, end])
+    if len(runs) == 1:
+        start, end = runs[0]
+        return samples[start:end]
 
-    return segmented or [samples]
+    sizes = [end - start for start, end in runs]
+    merged = _scratch_view("merge", sum(sizes))
+    offset = 0
+    for (start, end), n in zip(runs, sizes):
+        # 同 dtype 直接拷贝，跳过 __setitem__ 的广播/类型转换检查
+        np.copyto(merged[offset:offset + n], samples[start:end], casting="no")
+        offset += n
+    return merged
 
 
 # ── ASR / PUNC 推理 ──
 
+def _result_item_text(item) -> str:
+    if isinstance(item, dict):
+        text = item.get("text")
+        if isinstance(text, str) and text:
+            return text
+    elif hasattr(item, "text"):
+        return normalize_result_text(item.text)
+    return normalize_result_text(item)
+
+
+# 单次 ASR 前向的下限：短于 20ms（与 VAD 段过滤一致）或 RMS 低于 1e-4 的片段直接返回空文本
+MIN_ASR_SAMPLES = 320
+ASR_BLANK_MEAN_SQUARE = 1e-8
+
+
+def _is_blank_chunk(samples: np.ndarray) -> bool:
+    if samples.size < MIN_ASR_SAMPLES:
+        return True
+    return float(np.dot(samples, samples)) < ASR_BLANK_MEAN_SQUARE * samples.size
+
+
 def run_asr_once(samples: np.ndarray) -> str:
-    if not isinstance(samples, np.ndarray) or samples.size == 0:
+    if not isinstance(samples, np.ndarray) or _is_blank_chunk(samples):
         return ""
+    return _asr_forward(samples)
+
+
+def _asr_forward(samples: np.ndarray) -> str:
     if asr_model is None:
         return ""
 
-    if asr_backend == "funasr_onnx_contextual":
-        hotwords = normalize_hotwords_for_onnx(asr_hotwords_str)
-        result = asr_model(samples, hotwords=hotwords)
+    if asr_backend in CONTEXTUAL_BACKENDS:
+        result = asr_model(samples, hotwords=asr_hotwords_norm)
     elif asr_backend == "funasr_onnx_paraformer":
         result = asr_model(samples)
     else:
@@ -205,14 +325,216 @@ def run_asr_once(samples: np.ndarray) -> str:
 
     text = ""
     if result and len(result) > 0:
-        item = result[0]
-        if hasattr(item, "text"):
-            text = normalize_result_text(item.text)
-        else:
-            text = normalize_result_text(item)
+        text = _result_item_text(result[0])
     return text
 
 
+def run_asr_batch(batch: list[np.ndarray]) -> list[str]:
+    """一次前向识别多段音频（funasr_onnx 内部按最长段补零成二维批次）。"""
+    if len(batch) == 1:
+        return [run_asr_once(batch[0])]
+    model = asr_model
+    if model is None:
+        return [""] * len(batch)
+
+    # 过短/近静音的片段不参与补零批次，结果位置保持空文本
+    keep = [i for i, chunk in enumerate(batch) if not _is_blank_chunk(chunk)]
+    texts = [""] * len(batch)
+    if len(keep) <= 1:
+        for i in keep:
+            texts[i] = _asr_forward(batch[i])
+        return texts
+
+    chunks = [batch[i] for i in keep]
+    # batch_size 是共享模型上的属性，用完即恢复，单条推理路径不受影响
+    orig_batch_size = getattr(model, "batch_size", 1)
+    model.batch_size = len(chunks)
+    try:
+        if asr_backend in CONTEXTUAL_BACKENDS:
+            result = model(chunks, hotwords=asr_hotwords_norm)
+        else:
+            result = model(chunks)
+    finally:
+        model.batch_size = orig_batch_size
+    if not result or len(result) != len(chunks):
+        # funasr_onnx 捕获 ONNXRuntimeError 后整批只返回一个 ""：逐条重跑，
+        # 避免一个失败片段连累同批其他请求
+        for i in keep:
+            texts[i] = _asr_forward(batch[i])
+        return texts
+    for i, item in zip(keep, result):
+        texts[i] = _result_item_text(item)
+    return texts
+
+
+# ── 模型预热 ──
+
+# 预热输入：0.5 秒静音（足以触发内核选择与内存规划，init 少等一半）
+_WARMUP_SAMPLES = 8000
+
+
+def _warmup(model, run):
+    # 模型来自进程级缓存时可能已预热过，跳过
+    if model is None or getattr(model, "_logene_warmed", False):
+        return
+    try:
+        run()
+    except Exception:
+        # 预热失败不影响 init，首个真实请求再承担冷启动开销
+        return
+    try:
+        model._logene_warmed = True
+    except AttributeError:
+        pass
+
+
+def _warmup_asr():
+    silence = np.zeros(_WARMUP_SAMPLES, dtype=np.float32)
+    # 绕过 run_asr_once 的静音短路，确保真正跑一次前向
+    _warmup(asr_model, lambda: _asr_forward(silence))
+
+
+def _warmup_vad():
+    silence = np.zeros(_WARMUP_SAMPLES, dtype=np.float32)
+
+    def run():
+        with _vad_lock:
+            vad_model(silence)
+
+    _warmup(vad_model, run)
+
+
+def _warmup_punc():
+    _warmup(punc_model, lambda: run_punc("你好"))
+
+
+def warmup_models():
+    """加载后各跑一次推理，提前完成图绑定、内存规划与内核选择，避免首个识别请求慢。"""
+    warmup_kernels()
+    _warmup_vad()
+    _warmup_asr()
+    _warmup_punc()
+
+
+# ── ASR 动态微批 ──
+
+# 并发 recognize 在短时间窗内合并为一次 ASR 前向，摊薄会话调度开销
+MAX_ASR_BATCH = max(1, int(os.getenv("ASR_MAX_BATCH", "4")))
+ASR_BATCH_TIMEOUT_MS = max(0.0, float(os.getenv("ASR_BATCH_TIMEOUT_MS", "5")))
+_BATCHABLE_BACKENDS = CONTEXTUAL_BACKENDS + ("funasr_onnx_paraformer",)
+
+
+@dataclass
+class InferenceRequest:
+    samples: np.ndarray
+    future: Future
+
+
+_pending: "queue.SimpleQueue[InferenceRequest]" = queue.SimpleQueue()
+_batcher_thread: Optional[threading.Thread] = None
+_batcher_start_lock = threading.Lock()
+
+
+def _collect_batch() -> list[InferenceRequest]:
+    batch = [_pending.get()]
+    deadline = time.monotonic() + ASR_BATCH_TIMEOUT_MS / 1000.0
+    while len(batch) < MAX_ASR_BATCH:
+        remaining = deadline - time.monotonic()
+        try:
+            if remaining <= 0:
+                batch.append(_pending.get_nowait())
+            else:
+                batch.append(_pending.get(timeout=remaining))
+        except queue.Empty:
+            break
+    return batch
+
+
+def _batcher_loop():
+    while True:
+        batch = _collect_batch()
+        try:
+            texts = run_asr_batch([req.samples for req in batch])
+        except Exception as e:
+            for req in batch:
+                req.future.set_exception(e)
+            continue
+        for req, text in zip(batch, texts):
+            req.future.set_result(text)
+
+
+def _ensure_batcher():
+    global _batcher_thread
+    with _batcher_start_lock:
+        if _batcher_thread is None:
+            _batcher_thread = threading.Thread(
+                target=_batcher_loop, name="asr-batcher", daemon=True
+            )
+            _batcher_thread.start()
+
+
+def _run_asr_many(chunks: list[np.ndarray]) -> list[str]:
+    if MAX_ASR_BATCH <= 1 or asr_backend not in _BATCHABLE_BACKENDS:
+        return [run_asr_once(chunk) for chunk in chunks]
+    _ensure_batcher()
+    # chunks 可能是调用线程的暂存缓冲视图；调用方阻塞等待结果，期间不会被覆盖
+    reqs = [InferenceRequest(samples=chunk, future=Future()) for chunk in chunks]
+    for req in reqs:
+        _pending.put(req)
+    return [req.future.result() for req in reqs]
+
+
+# ── 长音频分窗 ──
+
+# 超过 30s 的音频按 25s 窗口（重叠 1s）切分后并发识别，避免单次超长序列的注意力开销
+MAX_SINGLE_PASS_SAMPLES = 30 * 16000
+LONG_AUDIO_WINDOW_SAMPLES = 25 * 16000
+LONG_AUDIO_OVERLAP_SAMPLES = 16000
+# 重叠 1s 约对应 4~6 个汉字，拼接时最多在这个范围内去重
+_MAX_STITCH_OVERLAP_CHARS = 12
+
+
+def _split_long_audio(samples: np.ndarray) -> list[np.ndarray]:
+    step = LONG_AUDIO_WINDOW_SAMPLES - LONG_AUDIO_OVERLAP_SAMPLES
+    windows = []
+    start = 0
+    while True:
+        end = min(samples.size, start + LONG_AUDIO_WINDOW_SAMPLES)
+        windows.append(samples[start:end])
+        if end >= samples.size:
+            break
+        start += step
+    return windows
+
+
+def _stitch_texts(texts: list[str]) -> str:
+    """拼接相邻窗口文本：去掉前文后缀与后文前缀的最长重复部分。"""
+    merged = ""
+    for text in texts:
+        text = text.strip()
+        if not text:
+            continue
+        limit = min(len(merged), len(text), _MAX_STITCH_OVERLAP_CHARS)
+        overlap = 0
+        for k in range(limit, 0, -1):
+            if merged.endswith(text[:k]):
+                overlap = k
+                break
+        merged += text[overlap:]
+    return merged
+
+
+def run_asr(samples: np.ndarray) -> tuple[str, int]:
+    """识别入口，返回 (文本, ASR 次数)。ONNX 后端经微批线程合并执行；
+    超长音频分窗后一起提交，由微批线程合并成批次前向。"""
+    if not isinstance(samples, np.ndarray) or samples.size == 0:
+        return "", 0
+    if samples.size <= MAX_SINGLE_PASS_SAMPLES:
+        return _run_asr_many([samples])[0], 1
+    windows = _split_long_audio(samples)
+    return _stitch_texts(_run_asr_many(windows)), len(windows)
+
+
 def run_punc(text: str) -> str:
     if not text or not text.strip():
         return ""
@@ -0,0 +1,53 @@
+"""PCM 解码内核 — 可选 Numba JIT 加速，未安装 numba 时回退 NumPy。
+
+numba 体积较大，未列入 requirements.txt；开发环境手动安装即可启用。
+"""
+
+import numpy as np
+
+try:
+    from numba import njit, types
+except ImportError:  # pragma: no cover - 取决于运行环境
+    njit = None
+
+_PCM16_SCALE = np.float32(1.0 / 32768.0)
+
+HAS_NUMBA = njit is not None
+
+if HAS_NUMBA:
+    # 显式签名在导入时即编译（cache=True 时直接加载磁盘缓存），首个请求不再触发 JIT。
+    # np.frombuffer 映射 bytes 得到的是只读数组，需单独列出只读签名
+    _F32_OUT = types.Array(types.float32, 1, "C")
+    _PCM16_SIGNATURES = [
+        types.void(types.Array(types.int16, 1, "C"), _F32_OUT),
+        types.void(types.Array(types.int16, 1, "C", readonly=True), _F32_OUT),
+    ]
+
+    @njit(_PCM16_SIGNATURES, cache=True, fastmath=True, boundscheck=False)
+    def _pcm16_to_f32_kernel(src, dst):
+        scale = np.float32(1.0 / 32768.0)
+        for i in range(src.size):
+            dst[i] = src[i] * scale
+
+
+def pcm16_to_f32(src: np.ndarray, dst: np.ndarray) -> np.ndarray:
+    """int16 PCM → [-1, 1) float32，单遍写入预分配的 dst（长度需与 src 一致）。"""
+    if HAS_NUMBA:
+        try:
+            _pcm16_to_f32_kernel(src, dst)
+            return dst
+        except TypeError:
+            # 非对齐 / 非连续等签名之外的布局
+            pass
+    # 显式指定 float32 内循环：类型转换与缩放在同一遍完成，不产生中间数组
+    np.multiply(src, _PCM16_SCALE, out=dst, dtype=np.float32, casting="unsafe")
+    return dst
+
+
+def warmup_kernels():
+    """init 时以小数组各跑一遍解码内核（含只读输入），让 JIT 缓存加载与 ufunc 初始化不落在首个识别上。"""
+    src = np.zeros(160, dtype=np.int16)
+    dst = np.empty(160, dtype=np.float32)
+    pcm16_to_f32(src, dst)
+    src.flags.writeable = False
+    pcm16_to_f32(src, dst)
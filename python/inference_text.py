@@ -0,0 +1,131 @@
+"""文本归一化 — 热词整理与 ASR 结果取文本，每次识别都会调用。
+
+纯 Python 且全部带类型注解：打包时若构建环境装有 mypy，build_sidecar.py 会用 mypyc
+将本模块预编译为 C 扩展，未安装时按源码运行，行为一致。
+"""
+
+from functools import lru_cache
+from typing import Any, Optional
+
+
+def _extract_hotwords(hotwords: str) -> list[str]:
+    words: list[str] = []
+    for line in hotwords.splitlines():
+        tokens = line.split()
+        if not tokens:
+            continue
+        # "词 权重" 格式只取词本身
+        if len(tokens) >= 2 and tokens[1].replace(".", "", 1).isdigit():
+            words.append(tokens[0])
+        else:
+            words.extend(tokens)
+    # dict.fromkeys 保序去重
+    return list(dict.fromkeys(words))
+
+
+# 热词只在 init 时变化：同一热词串直接返回同一个结果对象（下游按热词串缓存分词结果时比较也更快）
+@lru_cache(maxsize=8)
+def normalize_hotwords_for_onnx(hotwords: str) -> str:
+    # 空热词时 ContextualParaformer 仍需一个占位词
+    return " ".join(_extract_hotwords(hotwords)) or "。"
+
+
+# 结果字典中依次尝试的文本字段
+_RESULT_KEYS = ("text", "preds", "pred", "sentence", "transcript")
+
+
+def _leaf_text(value: Any) -> Optional[str]:
+    """叶子值直接给出文本；需要展开的 list/dict 返回 None。"""
+    if value is None:
+        return ""
+    if isinstance(value, str):
+        return value
+    if isinstance(value, (int, float, bool)):
+        return str(value)
+    if isinstance(value, (list, tuple)):
+        # ["文本", [时间戳...]] 之类的结构只取首个字符串
+        if (
+            len(value) >= 2
+            and isinstance(value[0], str)
+            and any(not isinstance(item, str) for item in value[1:])
+        ):
+            first = value[0].strip()
+            if first:
+                return first
+        return None if value else ""
+    if isinstance(value, dict):
+        return None if any(key in value for key in _RESULT_KEYS) else ""
+    return str(value)
+
+
+def _result_frame(node: Any) -> list[Any]:
+    # 帧：[节点, dict 的候选键（list 为 None）, 当前下标, list 已收集的片段]
+    if isinstance(node, dict):
+        return [node, [key for key in _RESULT_KEYS if key in node], 0, None]
+    return [node, None, 0, []]
+
+
+def _pair_text(value: Any) -> Optional[str]:
+    """("文本", [token...]) 二元组（funasr_onnx 的 preds、CT_Transformer 的返回值）直接取文本；
+    其他形状返回 None，交给通用遍历。"""
+    if (
+        (type(value) is tuple or type(value) is list)
+        and len(value) == 2
+        and type(value[0]) is str
+        and not isinstance(value[1], str)
+    ):
+        return value[0].strip() or None
+    return None
+
+
+def normalize_result_text(value: Any) -> str:
+    # 快速路径：已是字符串、("文本", tokens) 二元组，或 FunASR 常规输出 {"text": str} / {"preds": ...}；
+    # 按精确类型判断，不走 isinstance 链
+    value_type = type(value)
+    if value_type is str:
+        return value
+    if value_type is dict:
+        text = value.get("text")
+        if type(text) is str and text:
+            return text
+        # text 缺失或为空时按字段顺序轮到 preds
+        if text is None or type(text) is str:
+            preds = value.get("preds")
+            if type(preds) is str and preds:
+                return preds
+            text = _pair_text(preds)
+            if text:
+                return text
+    elif value_type is tuple or value_type is list:
+        text = _pair_text(value)
+        if text:
+            return text
+    text = _leaf_text(value)
+    if text is not None:
+        return text
+
+    # 显式栈遍历：list 拼接各子项文本，dict 取首个非空字段
+    stack: list[list[Any]] = [_result_frame(value)]
+    result: Optional[str] = None
+    while stack:
+        frame = stack[-1]
+        node, keys, idx, parts = frame
+        if result is not None:
+            if keys is None:
+                if result:
+                    parts.append(result)
+            elif result:
+                stack.pop()
+                continue
+            idx += 1
+            frame[2] = idx
+            result = None
+        if idx >= (len(node) if keys is None else len(keys)):
+            stack.pop()
+            result = "".join(parts) if keys is None else ""
+            continue
+        child = node[idx] if keys is None else node[keys[idx]]
+        result = _leaf_text(child)
+        if result is None:
+            stack.append(_result_frame(child))
+    return result or ""
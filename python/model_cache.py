@@ -1,18 +1,43 @@
 """模型缓存、下载、依赖检查。"""
 
+import contextlib
+import hashlib
 import os
 import shutil
+import stat
+import sys
 import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from functools import lru_cache
 from typing import Optional
 
-from protocol import send_json
+from protocol import send_msg
 
 # 兼容目录（某些量化模型文件命名与 funasr_onnx 预期不一致时使用）
 _compat_model_dirs: list[str] = []
+# 兼容目录复用：(模型目录, 源文件 mtime) → 兼容目录，重复 init 不再重建
+_compat_cache: dict[tuple, str] = {}
+# 兼容目录中的模型文件 → 模型目录中的原文件（硬链接/拷贝时 realpath 停在每次新建的临时目录里）
+_compat_sources: dict[str, str] = {}
 # 当前热词临时文件路径（用于清理）
 _hotword_tmp: Optional[str] = None
-
-
+# 当前热词临时文件内容的摘要，热词未变化时复用原文件
+_hotword_hash: Optional[str] = None
+# is_model_cached 结果缓存：model_id → (目录 mtime_ns, 是否已缓存)，目录变化时失效
+_cached_state: dict[str, tuple[int, bool]] = {}
+# 正在下载的模型目录：期间文件不断增删，目录相关判定不读也不写缓存
+_downloading_dirs: set[str] = set()
+# FAT/exFAT 的 mtime 精度为 2s（部分网络盘更粗）：同一时间片内的增删不改变目录 mtime。
+# 扫描时目录距上次修改不足该时长，结果就不入缓存，下次重新扫描
+_MTIME_SETTLE_NS = 2_000_000_000
+# 模型目录文件列表缓存：目录 → (mtime_ns, 文件名集合)，UI 轮询 check 时不再重复扫描目录
+_listing_cache: dict[str, tuple[int, frozenset[str]]] = {}
+_LISTING_CACHE_SIZE = 32
+
+
+@lru_cache(maxsize=128)
 def resolve_model_id(model_name: str) -> str:
     """将 FunASR 短名解析为 ModelScope model_id"""
     funasr_map = {
@@ -21,6 +46,7 @@ def resolve_model_id(model_name: str) -> str:
     return funasr_map.get(model_name, model_name)
 
 
+@lru_cache(maxsize=128)
 def get_model_cache_path(model_id: str) -> str:
     cache_root = os.path.join(
         os.path.expanduser("~"), ".cache", "modelscope", "hub", "models"
@@ -28,13 +54,45 @@ def get_model_cache_path(model_id: str) -> str:
     return os.path.join(cache_root, model_id.replace("/", os.sep))
 
 
+def _has_any_file(root: str) -> bool:
+    # scandir 直接使用目录项类型，找到第一个文件即返回，不做逐项 stat
+    stack = [root]
+    while stack:
+        try:
+            with os.scandir(stack.pop()) as it:
+                for entry in it:
+                    if entry.is_file():
+                        return True
+                    if entry.is_dir(follow_symlinks=False):
+                        stack.append(entry.path)
+        except OSError:
+            continue
+    return False
+
+
+def _mtime_cacheable(model_dir: str, mtime_ns: int) -> bool:
+    """目录 mtime 能否作为缓存键：下载中或刚被修改过的目录，mtime 不足以反映内容变化。"""
+    return model_dir not in _downloading_dirs and time.time_ns() - mtime_ns > _MTIME_SETTLE_NS
+
+
 def is_model_cached(model_id: str) -> bool:
     model_path = get_model_cache_path(model_id)
-    if os.path.isdir(model_path):
-        for _, _, files in os.walk(model_path):
-            if files:
-                return True
-    return False
+    try:
+        st = os.stat(model_path)
+    except OSError:
+        _cached_state.pop(model_id, None)
+        return False
+    cacheable = _mtime_cacheable(model_path, st.st_mtime_ns)
+    hit = _cached_state.get(model_id)
+    if cacheable and hit is not None and hit[0] == st.st_mtime_ns:
+        return hit[1]
+    # 复用上面 stat 的结果判断目录，不再额外 stat 一次
+    cached = stat.S_ISDIR(st.st_mode) and _has_any_file(model_path)
+    if cacheable:
+        _cached_state[model_id] = (st.st_mtime_ns, cached)
+    else:
+        _cached_state.pop(model_id, None)
+    return cached
 
 
 def validate_onnx_files(model_dir: str, backend: str, quantize: bool):
@@ -45,32 +103,60 @@ def validate_onnx_files(model_dir: str, backend: str, quantize: bool):
         )
 
 
+def _list_files(model_dir: str) -> frozenset[str]:
+    # 一次 scandir 读出目录项，代替逐个文件 os.path.exists；
+    # 目录 mtime 未变（没有增删文件）时直接复用上次结果，只花一次 stat
+    try:
+        mtime_ns = os.stat(model_dir).st_mtime_ns
+    except OSError:
+        _listing_cache.pop(model_dir, None)
+        return frozenset()
+    cacheable = _mtime_cacheable(model_dir, mtime_ns)
+    hit = _listing_cache.get(model_dir)
+    if cacheable and hit is not None and hit[0] == mtime_ns:
+        return hit[1]
+    try:
+        with os.scandir(model_dir) as it:
+            files = frozenset(entry.name for entry in it if entry.is_file())
+    except OSError:
+        return frozenset()
+    if not cacheable:
+        _listing_cache.pop(model_dir, None)
+        return files
+    if len(_listing_cache) >= _LISTING_CACHE_SIZE and model_dir not in _listing_cache:
+        _listing_cache.pop(next(iter(_listing_cache)))
+    _listing_cache[model_dir] = (mtime_ns, files)
+    return files
+
+
 def get_missing_onnx_files(model_dir: str, backend: str, quantize: bool):
+    files = _list_files(model_dir)
+
     # PUNC ONNX 模型只提供 model_quant.onnx，不需要常规 ASR 的文件检查
     if backend == "funasr_onnx_punc":
-        if not os.path.exists(os.path.join(model_dir, "model_quant.onnx")):
+        if "model_quant.onnx" not in files:
             return ["model_quant.onnx"]
         return []
 
+    # 混合精度：INT8 主干 + FP32 热词 embedding，与 quantize 无关
+    if backend == "funasr_onnx_contextual_mixed":
+        return [name for name in ("model_quant.onnx", "model_eb.onnx") if name not in files]
+
     missing = []
     if quantize:
-        if not os.path.exists(os.path.join(model_dir, "model_quant.onnx")):
+        if "model_quant.onnx" not in files:
             missing.append("model_quant.onnx")
     else:
         # 部分 ONNX 模型仓库只提供量化版，两者有其一即可
-        has_plain = os.path.exists(os.path.join(model_dir, "model.onnx"))
-        has_quant = os.path.exists(os.path.join(model_dir, "model_quant.onnx"))
-        if not (has_plain or has_quant):
+        if not ({"model.onnx", "model_quant.onnx"} & files):
             missing.append("model.onnx")
 
     if backend == "funasr_onnx_contextual":
         if quantize:
-            has_quant_eb = os.path.exists(os.path.join(model_dir, "model_eb_quant.onnx"))
-            has_plain_eb = os.path.exists(os.path.join(model_dir, "model_eb.onnx"))
-            if not (has_quant_eb or has_plain_eb):
+            if not ({"model_eb_quant.onnx", "model_eb.onnx"} & files):
                 missing.append("model_eb_quant.onnx|model_eb.onnx")
         else:
-            if not os.path.exists(os.path.join(model_dir, "model_eb.onnx")):
+            if "model_eb.onnx" not in files:
                 missing.append("model_eb.onnx")
     return missing
 
@@ -87,62 +173,135 @@ def resolve_model_dir(model_name: str) -> str:
     return model_name
 
 
+def _clone_file(src: str, dst: str) -> bool:
+    """不经用户态缓冲复制文件：macOS 用 clonefile（APFS 写时复制，仅元数据操作），
+    Linux 用 copy_file_range（Btrfs/XFS 上为 reflink，其余文件系统也在内核内完成）。不支持时返回 False。"""
+    if sys.platform == "darwin":
+        import ctypes
+
+        clonefile = getattr(ctypes.CDLL(None, use_errno=True), "clonefile", None)
+        return clonefile is not None and clonefile(os.fsencode(src), os.fsencode(dst), 0) == 0
+    copy_file_range = getattr(os, "copy_file_range", None)
+    if copy_file_range is None:
+        return False
+    try:
+        with open(src, "rb") as fsrc, open(dst, "xb") as fdst:
+            remaining = os.fstat(fsrc.fileno()).st_size
+            while remaining > 0:
+                copied = copy_file_range(fsrc.fileno(), fdst.fileno(), remaining)
+                if copied <= 0:
+                    break
+                remaining -= copied
+        if remaining == 0:
+            return True
+    except OSError:
+        pass
+    with contextlib.suppress(OSError):
+        os.remove(dst)
+    return False
+
+
 def _copy_or_link(src: str, dst: str):
+    # Windows 未开开发者模式时 symlink 需要特权；NTFS 硬链接无需特权；跨文件系统时优先克隆，最后才整份拷贝
     try:
         os.symlink(src, dst)
-    except Exception:
-        shutil.copy2(src, dst)
+        return
+    except OSError:
+        pass
+    try:
+        os.link(src, dst)
+        return
+    except OSError:
+        pass
+    if _clone_file(src, dst):
+        return
+    shutil.copy2(src, dst)
 
 
-def adapt_contextual_quant_model_dir(model_dir: str, quantize: bool):
+def adapt_contextual_quant_model_dir(model_dir: str, quantize: bool, fp32_embedder: bool = False):
+    """量化主干搭配 FP32 热词 embedding 时，组装 funasr_onnx 按非量化命名加载的兼容目录。
+    fp32_embedder=True 时即使仓库带有 model_eb_quant.onnx 也使用 FP32 的 model_eb.onnx。"""
     if not quantize:
         return model_dir, False
 
     quant_bb = os.path.join(model_dir, "model_quant.onnx")
     quant_eb = os.path.join(model_dir, "model_eb_quant.onnx")
     plain_eb = os.path.join(model_dir, "model_eb.onnx")
-    if os.path.exists(quant_bb) and os.path.exists(quant_eb):
+    if not fp32_embedder and os.path.exists(quant_bb) and os.path.exists(quant_eb):
         return model_dir, True
     if not (os.path.exists(quant_bb) and os.path.exists(plain_eb)):
         return model_dir, True
 
+    # 源文件 mtime 纳入键：模型重新下载后，硬链接 / 拷贝出的旧文件不会被误用
+    key = (
+        os.path.realpath(model_dir),
+        os.stat(quant_bb).st_mtime_ns,
+        os.stat(plain_eb).st_mtime_ns,
+    )
+    cached = _compat_cache.get(key)
+    if cached and os.path.isdir(cached):
+        return cached, False
+
     compat_dir = tempfile.mkdtemp(prefix="funasr-ctx-compat-")
     for filename in ("config.yaml", "am.mvn", "tokens.json", "configuration.json"):
         src = os.path.join(model_dir, filename)
         if os.path.exists(src):
             _copy_or_link(src, os.path.join(compat_dir, filename))
-    _copy_or_link(quant_bb, os.path.join(compat_dir, "model.onnx"))
-    _copy_or_link(plain_eb, os.path.join(compat_dir, "model_eb.onnx"))
+    real_compat_dir = os.path.realpath(compat_dir)
+    for src, name in ((quant_bb, "model.onnx"), (plain_eb, "model_eb.onnx")):
+        _copy_or_link(src, os.path.join(compat_dir, name))
+        _compat_sources[os.path.join(real_compat_dir, name)] = os.path.realpath(src)
     _compat_model_dirs.append(compat_dir)
+    _compat_cache[key] = compat_dir
     return compat_dir, False
 
 
-def write_hotwords_tmp(hotwords: str) -> str:
-    global _hotword_tmp
+def source_model_file(path: str) -> str:
+    """模型文件的真实来源：兼容目录中的文件映射回模型目录中的原文件，其余取 realpath。"""
+    real = os.path.realpath(path)
+    return _compat_sources.get(real, real)
+
+
+def _remove_hotwords_tmp():
+    global _hotword_tmp, _hotword_hash
     if _hotword_tmp and os.path.exists(_hotword_tmp):
         os.unlink(_hotword_tmp)
-        _hotword_tmp = None
+    _hotword_tmp = None
+    _hotword_hash = None
 
+
+def write_hotwords_tmp(hotwords: str) -> str:
+    global _hotword_tmp, _hotword_hash
     if not hotwords or not hotwords.strip():
+        _remove_hotwords_tmp()
         return ""
 
+    digest = hashlib.blake2b(hotwords.encode("utf-8"), digest_size=8).hexdigest()
+    if digest == _hotword_hash and _hotword_tmp and os.path.exists(_hotword_tmp):
+        return _hotword_tmp
+
+    _remove_hotwords_tmp()
     fd, path = tempfile.mkstemp(suffix=".txt", prefix="funasr-hotwords-")
     with os.fdopen(fd, "w", encoding="utf-8") as f:
         f.write(hotwords)
     _hotword_tmp = path
+    _hotword_hash = digest
     return path
 
 
-def cleanup_tmp_files():
-    global _hotword_tmp
-    if _hotword_tmp and os.path.exists(_hotword_tmp):
-        os.unlink(_hotword_tmp)
-    _hotword_tmp = None
+def cleanup_compat_dirs():
+    _compat_cache.clear()
+    _compat_sources.clear()
     while _compat_model_dirs:
         path = _compat_model_dirs.pop()
         shutil.rmtree(path, ignore_errors=True)
 
 
+def cleanup_tmp_files():
+    _remove_hotwords_tmp()
+    cleanup_compat_dirs()
+
+
 def build_dependencies(
     model_name: str,
     backend: str,
@@ -182,53 +341,149 @@ def build_dependencies(
     return deps
 
 
-def download_model_with_progress(dependencies, msg_id: int):
+# 下载进度最短上报间隔：大文件的字节回调不至于刷满 stdout 管道
+_PROGRESS_MIN_INTERVAL_S = 0.05
+
+# 大文件走 modelscope 内置的多连接分片下载（默认仅 500MB 以上才分片、4 连接）。
+# 这两个值在导入 modelscope 时读取，需在导入前设置；用户显式配置的环境变量优先
+_DOWNLOAD_ENV_DEFAULTS = {
+    "MODELSCOPE_PARALLEL_DOWNLOAD_THRESHOLD_MB": "10",
+    "MODELSCOPE_DOWNLOAD_PARALLELS": "8",
+}
+
+
+def _file_progress_callbacks(report) -> list:
+    """按字节汇总 snapshot_download 各文件进度，以 report(完成比例, 文件名) 回报。"""
+    try:
+        from modelscope.hub.callback import ProgressCallback
+    except ImportError:
+        return []
+
+    lock = threading.Lock()
+    # [已下载字节, 已登记文件总字节]
+    state = [0, 0]
+
+    class _FileProgress(ProgressCallback):
+        def __init__(self, filename: str, file_size: int):
+            super().__init__(filename, file_size)
+            self._name = os.path.basename(filename)
+            with lock:
+                state[1] += max(0, int(file_size or 0))
+
+        def update(self, size: int):
+            with lock:
+                state[0] += size
+                if not state[1]:
+                    return
+                fraction = min(1.0, state[0] / state[1])
+            report(fraction, self._name)
+
+        def end(self):
+            pass
+
+    return [_FileProgress]
+
+
+@lru_cache(maxsize=1)
+def _snapshot_download():
+    """首次下载时才导入 modelscope（体积大、导入慢），之后直接复用函数引用。"""
+    for key, value in _DOWNLOAD_ENV_DEFAULTS.items():
+        os.environ.setdefault(key, value)
     from modelscope.hub.snapshot_download import snapshot_download
 
+    return snapshot_download
+
+
+def download_model_with_progress(dependencies, msg_id: int):
+    snapshot_download = _snapshot_download()
+
     total = len(dependencies)
     if total == 0:
-        send_json({"id": msg_id, "progress": 90})
+        send_msg({"id": msg_id, "progress": 90})
         return
 
+    # 各依赖的完成比例；总进度 = 平均完成比例 × 90，只增不减（并发下载时各依赖进度交错到达）
+    fractions = [0.0] * total
+    progress_lock = threading.Lock()
+    # [上次上报的进度, 上报时刻]
+    last_sent = [-1, 0.0]
+
+    def report(index: int, fraction: float, status: str = "", force: bool = False):
+        # 字节级回调非常频繁：整数进度前进且距上次上报满间隔才发送；阶段性状态与依赖完成（force）总是上报
+        with progress_lock:
+            fractions[index] = max(fractions[index], fraction)
+            progress = max(last_sent[0], int(sum(fractions) / total * 90))
+            now = time.monotonic()
+            if not force and (
+                progress <= last_sent[0] or now - last_sent[1] < _PROGRESS_MIN_INTERVAL_S
+            ):
+                return
+            last_sent[0] = progress
+            last_sent[1] = now
+        msg = {"id": msg_id, "progress": progress}
+        if status:
+            msg["status"] = status
+        send_msg(msg)
+
+    # 缓存检查很快，先同步做完，只把真正需要下载的依赖放进线程池
+    to_download = []
     for i, dep in enumerate(dependencies):
         model_name = dep["modelName"]
         backend = dep.get("backend", "")
         quantize = bool(dep.get("quantize", False))
         role = dep.get("role", "Model")
-        base_progress = int((i / total) * 90)
-        next_progress = int(((i + 1) / total) * 90)
-
         try:
             resolved = resolve_model_id(model_name)
             if is_model_cached(resolved):
-                if backend.startswith("funasr_onnx"):
-                    try:
-                        validate_onnx_files(get_model_cache_path(resolved), backend, quantize)
-                        send_json({"id": msg_id, "progress": next_progress})
-                        continue
-                    except RuntimeError:
-                        # 缓存不完整，删除后重新下载
-                        import shutil
-                        cache_path = get_model_cache_path(resolved)
-                        send_json({"id": msg_id, "progress": base_progress, "status": f"{role}模型缓存不完整，正在重新下载..."})
-                        shutil.rmtree(cache_path, ignore_errors=True)
-                else:
-                    send_json({"id": msg_id, "progress": next_progress})
+                if not backend.startswith("funasr_onnx"):
+                    report(i, 1.0, force=True)
+                    continue
+                try:
+                    validate_onnx_files(get_model_cache_path(resolved), backend, quantize)
+                    report(i, 1.0, force=True)
                     continue
+                except RuntimeError:
+                    # 缓存不完整，删除后重新下载
+                    report(i, 0.0, f"{role}模型缓存不完整，正在重新下载...", force=True)
+                    shutil.rmtree(get_model_cache_path(resolved), ignore_errors=True)
+        except Exception as e:
+            raise RuntimeError(f"预下载 {role} 模型失败: {model_name}") from e
+        to_download.append((i, dep, resolved))
 
-            send_json(
-                {
-                    "id": msg_id,
-                    "progress": base_progress,
-                    "status": f"下载{role}模型 {model_name}...",
-                }
+    def download(index: int, dep, resolved: str):
+        model_name = dep["modelName"]
+        backend = dep.get("backend", "")
+        quantize = bool(dep.get("quantize", False))
+        role = dep.get("role", "Model")
+        model_path = get_model_cache_path(resolved)
+        _downloading_dirs.add(model_path)
+        try:
+            report(index, 0.0, f"下载{role}模型 {model_name}...", force=True)
+            callbacks = _file_progress_callbacks(
+                lambda fraction, name: report(index, fraction, f"下载{role}模型 {name}...")
             )
-            model_dir = snapshot_download(resolved)
+            if callbacks:
+                model_dir = snapshot_download(resolved, progress_callbacks=callbacks)
+            else:
+                model_dir = snapshot_download(resolved)
             if backend.startswith("funasr_onnx"):
                 validate_onnx_files(model_dir, backend, quantize)
-            send_json({"id": msg_id, "progress": next_progress})
+            report(index, 1.0, force=True)
         except Exception as e:
             raise RuntimeError(f"预下载 {role} 模型失败: {model_name}") from e
+        finally:
+            _downloading_dirs.discard(model_path)
+
+    if len(to_download) <= 1:
+        for item in to_download:
+            download(*item)
+        return
+
+    # ASR/VAD/PUNC 互不依赖，并发下载：冷启动耗时取决于最慢的一个而不是三者之和
+    with ThreadPoolExecutor(max_workers=len(to_download), thread_name_prefix="download") as pool:
+        futures = [pool.submit(download, *item) for item in to_download]
+        for future in as_completed(futures):
+            future.result()
 
 
 def is_dependency_downloaded(dep) -> bool:
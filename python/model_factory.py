@@ -1,13 +1,49 @@
 """模型工厂 — 创建 ASR / VAD / PUNC 模型实例。"""
 
+import contextlib
+import functools
+import glob
+import hashlib
 import importlib.machinery
 import importlib
 import importlib.util
 import os
+import shutil
 import sys
+import threading
 import types
+from collections import OrderedDict
 
-from model_cache import resolve_model_dir, adapt_contextual_quant_model_dir
+import numpy as np
+
+from inference import CONTEXTUAL_BACKENDS, MAX_ASR_BATCH
+from model_cache import resolve_model_dir, adapt_contextual_quant_model_dir, source_model_file
+
+# ORT 图优化结果缓存目录（按模型文件指纹区分，首次 init 写入，之后直接加载）
+_ORT_CACHE_DIR = os.path.join(
+    os.path.expanduser("~"), ".cache", "logene-voice-input", "ort"
+)
+
+# 进程级模型缓存：同配置的 init（含 dispose 之后）直接复用已加载会话，LRU 淘汰
+MAX_CACHED_SESSIONS = max(1, int(os.getenv("ASR_MAX_CACHED_SESSIONS", "4")))
+_model_cache: "OrderedDict[tuple, object]" = OrderedDict()
+_model_cache_lock = threading.Lock()
+
+# ASR intra-op 线程数上限；VAD/PUNC 取其一半。可通过环境变量（ASR_INTRA_OP / VAD_INTRA_OP / PUNC_INTRA_OP）覆盖
+_MAX_ASR_INTRA_OP_THREADS = 8
+
+# 量化模型在支持 VNNI/AMX 的 CPU 上优先尝试的 INT8 加速 EP（需安装对应的 onnxruntime 发行版）
+_INT8_EXECUTION_PROVIDERS = ("DnnlExecutionProvider", "OpenVINOExecutionProvider")
+_INT8_CPU_FLAGS = ("avx512_vnni", "avx_vnni", "amx_int8")
+# 按 CPU 能力自动选择 ASR 精度（ASR_AUTO_INT8=0 关闭）：支持 VNNI/AMX 时 FP32 模型目录里带有量化文件则改用 INT8；
+# 不支持时 INT8 GEMM 退化为 pmaddubsw 拼接，通常比 FP32 还慢，目录里有 FP32 模型则改回 FP32
+AUTO_INT8 = os.getenv("ASR_AUTO_INT8", "1") != "0"
+# 同样条件下，在后台用 FP32 原模型重新生成 S8 权重（逐通道）的量化模型，生成后替换仓库自带的 U8 量化模型。
+# 转换耗时数分钟且占用大量内存，默认关闭（ASR_INT8_REQUANT=1 开启）
+INT8_REQUANT = os.getenv("ASR_INT8_REQUANT", "0") != "0"
+# 后台重新量化线程：目标文件 → 线程，同一模型只转换一次
+_requant_threads: dict[str, threading.Thread] = {}
+_requant_lock = threading.Lock()
 
 
 def _ensure_funasr_onnx_namespace():
@@ -30,11 +66,11 @@ def _ensure_funasr_onnx_namespace():
 
 
 def _load_funasr_onnx_submodule(module_name: str):
-    _ensure_funasr_onnx_namespace()
     full_name = f"funasr_onnx.{module_name}"
     loaded = sys.modules.get(full_name)
     if loaded is not None:
         return loaded
+    _ensure_funasr_onnx_namespace()
 
     try:
         return importlib.import_module(full_name)
@@ -42,84 +78,595 @@ def _load_funasr_onnx_submodule(module_name: str):
         raise ImportError(f"unable to import {full_name}: {e}") from e
 
 
-def create_asr_model(model_name: str, backend: str, quantize: bool):
-    if backend == "funasr_onnx_contextual":
+@functools.lru_cache(maxsize=None)
+def _funasr_onnx_class(module_name: str, class_name: str):
+    """按需导入一次 funasr_onnx 模型类并缓存引用，后续 init 不再走导入机制。"""
+    try:
+        return getattr(_load_funasr_onnx_submodule(module_name), class_name)
+    except (ImportError, AttributeError) as e:
+        raise RuntimeError("缺少 funasr_onnx 依赖，请安装 requirements.txt 后重试") from e
+
+
+def _free_dimension_overrides(role: str, model_file: str) -> dict:
+    """需要固定的符号维度。VAD/PUNC 永远单条推理；ASR 仅在关闭微批时固定 batch。
+    热词 embedding 模型（model_eb*）的首维是热词个数，不能固定。"""
+    if os.path.basename(model_file).startswith("model_eb"):
+        return {}
+    if role == "ASR" and MAX_ASR_BATCH > 1:
+        return {}
+    return {"batch_size": 1}
+
+
+def _provider_names(providers) -> list[str]:
+    return [p if isinstance(p, str) else p[0] for p in providers or []]
+
+
+@functools.lru_cache(maxsize=None)
+def _numpy_cpu_features() -> dict:
+    try:
+        from numpy._core._multiarray_umath import __cpu_features__ as features
+    except ImportError:
+        try:
+            from numpy.core._multiarray_umath import __cpu_features__ as features
+        except ImportError:
+            features = {}
+    return features
+
+
+@functools.lru_cache(maxsize=None)
+def _cpu_signature() -> str:
+    """CPU 指令集指纹：预打包权重的布局随 MLAS 选中的内核（AVX2 / AVX512 / AMX …）变化。"""
+    enabled = sorted(name for name, on in _numpy_cpu_features().items() if on)
+    return hashlib.sha1(",".join(enabled).encode("ascii")).hexdigest()[:8]
+
+
+@functools.lru_cache(maxsize=None)
+def _cpu_has_int8_dot() -> bool:
+    """CPU 是否支持 VNNI / AMX 整数点积（没有这些指令时 INT8 并不比 FP32 快）。"""
+    features = _numpy_cpu_features()
+    # NumPy 的 AVX512_CLX 及之后的特性组均包含 AVX512_VNNI
+    if any(features.get(k) for k in ("AVX512_CLX", "AVX512_ICL", "AVX512_SPR")):
+        return True
+    try:
+        with open("/proc/cpuinfo", encoding="utf-8", errors="replace") as f:
+            for line in f:
+                if line.startswith("flags"):
+                    flags = set(line.split(":", 1)[-1].split())
+                    return any(flag in flags for flag in _INT8_CPU_FLAGS)
+    except OSError:
+        pass
+    return False
+
+
+def _select_providers(providers, model_file):
+    """量化模型 + VNNI/AMX CPU + 已安装 DNNL/OpenVINO EP 时改用 INT8 加速 EP，其余情况保持原样。"""
+    if not isinstance(model_file, str):
+        return providers
+    name = os.path.basename(model_file)
+    if "_quant" not in name and not name.endswith(".s8.onnx"):
+        return providers
+    if any(name != "CPUExecutionProvider" for name in _provider_names(providers)):
+        return providers
+    if not _cpu_has_int8_dot():
+        return providers
+    import onnxruntime as ort
+
+    available = ort.get_available_providers()
+    for name in _INT8_EXECUTION_PROVIDERS:
+        if name in available:
+            if name == "DnnlExecutionProvider":
+                # DNNL 内部走 OpenMP 线程池，未设置时会占满全部逻辑核
+                os.environ.setdefault("OMP_NUM_THREADS", str(_default_intra_op_threads("ASR")))
+            return [name, "CPUExecutionProvider"]
+    return providers
+
+
+def _cache_source_tag(model_file: str) -> str:
+    """缓存文件名前缀：同一源模型各代缓存（ORT 升级、模型重新下载后键会变）共享前缀，便于清理旧副本。
+    兼容目录每个进程新建，按其中文件对应的模型目录原文件计算，重启后前缀不变。"""
+    return hashlib.sha1(source_model_file(model_file).encode("utf-8")).hexdigest()[:8]
+
+
+def _prune_cache_entries(pattern: str, keep_prefix: str = "") -> list[str]:
+    """删除 _ORT_CACHE_DIR 中匹配 pattern 且文件名不以 keep_prefix 开头的缓存项，返回被删除的路径。"""
+    removed = []
+    for path in glob.glob(os.path.join(_ORT_CACHE_DIR, pattern)):
+        if keep_prefix and os.path.basename(path).startswith(keep_prefix):
+            continue
+        if os.path.isdir(path):
+            shutil.rmtree(path, ignore_errors=True)
+        else:
+            # Windows 上仍被其他进程映射的文件删不掉，留待下次
+            with contextlib.suppress(OSError):
+                os.unlink(path)
+        removed.append(path)
+    return removed
+
+
+def _optimized_model_key(model_file: str, role: str, providers) -> str:
+    import onnxruntime as ort
+
+    source = source_model_file(model_file)
+    st = os.stat(source)
+    overrides = ",".join(
+        f"{k}={v}" for k, v in sorted(_free_dimension_overrides(role, model_file).items())
+    )
+    # ORT_ENABLE_ALL 的优化结果可能含 EP 专属融合算子，不同 EP 分开缓存；
+    # 外部数据文件里还存有按 CPU 内核预打包的权重，换了 CPU 也要重建
+    raw = (
+        f"{source}|{st.st_size}|{st.st_mtime_ns}|"
+        f"{ort.__version__}|{overrides}|{'+'.join(_provider_names(providers))}|"
+        f"prepacked|{_cpu_signature()}"
+    )
+    return hashlib.sha1(raw.encode("utf-8")).hexdigest()[:16]
+
+
+@functools.lru_cache(maxsize=None)
+def _physical_cores() -> int:
+    """物理核心数（超线程的兄弟逻辑核对 GEMM 几乎没有收益，反而增加调度开销）。"""
+    try:
+        import psutil
+
+        count = psutil.cpu_count(logical=False)
+        if count:
+            return count
+    except ImportError:
+        pass
+    try:
+        cores = set()
+        physical_id = ""
+        with open("/proc/cpuinfo", encoding="utf-8", errors="replace") as f:
+            for line in f:
+                key, _, value = line.partition(":")
+                key = key.strip()
+                if key == "physical id":
+                    physical_id = value.strip()
+                elif key == "core id":
+                    cores.add((physical_id, value.strip()))
+        if cores:
+            return len(cores)
+    except OSError:
+        pass
+    return os.cpu_count() or 1
+
+
+def _default_intra_op_threads(role: str) -> int:
+    asr_threads = max(1, min(_physical_cores(), _MAX_ASR_INTRA_OP_THREADS))
+    if role == "ASR":
+        return asr_threads
+    return max(1, asr_threads // 2)
+
+
+def _requant_excluded_nodes(fp32_file: str) -> list[str]:
+    """与 FunASR 导出 model_quant.onnx 时一致：输出投影与 bias encoder/decoder 对精度敏感，保持 FP32。"""
+    import onnx
+
+    graph = onnx.load(fp32_file, load_external_data=False).graph
+    return [
+        node.name
+        for node in graph.node
+        if "output" in node.name or "bias_encoder" in node.name or "bias_decoder" in node.name
+    ]
+
+
+def _requantize_to_s8(fp32_file: str, out_path: str, tag: str, key: str):
+    tmp_path = f"{out_path}.{os.getpid()}.tmp"
+    try:
+        from onnxruntime.quantization import QuantType, quantize_dynamic
+
+        sys.stderr.write(f"[ORT] 后台生成 S8 逐通道量化模型: {fp32_file}\n")
+        sys.stderr.flush()
+        # 配方同 FunASR 导出：只量化 MatMul，仅把权重类型换成 S8
+        quantize_dynamic(
+            fp32_file,
+            tmp_path,
+            op_types_to_quantize=["MatMul"],
+            per_channel=True,
+            reduce_range=False,
+            weight_type=QuantType.QInt8,
+            nodes_to_exclude=_requant_excluded_nodes(fp32_file),
+        )
+        os.replace(tmp_path, out_path)
+        # 清理同一 FP32 模型的旧 S8 文件，连同由它们生成的已优化模型缓存
+        for old_path in _prune_cache_entries(f"{tag}-*.s8.onnx*", f"{tag}-{key}."):
+            _prune_cache_entries(f"{_cache_source_tag(old_path)}-*.opt.*")
+        sys.stderr.write(f"[ORT] S8 量化模型已生成，下次启动生效: {out_path}\n")
+    except Exception as e:
+        with contextlib.suppress(OSError):
+            os.unlink(tmp_path)
+        sys.stderr.write(f"[ORT] S8 重新量化失败，继续使用原量化模型: {type(e).__name__}: {e}\n")
+    sys.stderr.flush()
+
+
+def _requantized_model(model_file, role: str):
+    """仓库自带的 model_quant.onnx 为 U8 权重，ORT 在 VNNI 上只对 U8 激活 × S8 权重走快速内核。
+    开启 ASR_INT8_REQUANT、CPU 支持 VNNI/AMX 且同目录有 FP32 model.onnx 时，返回已生成的 S8 量化模型；
+    尚未生成时在后台线程转换（不占用模型缓存锁），本次仍返回 None 沿用原文件。"""
+    if (
+        role != "ASR"
+        or not INT8_REQUANT
+        or not isinstance(model_file, str)
+        # 混合精度兼容目录中以 model.onnx 之名链接/拷贝自原 model_quant.onnx
+        or os.path.basename(source_model_file(model_file)) != "model_quant.onnx"
+        or not _cpu_has_int8_dot()
+    ):
+        return None
+    fp32_file = os.path.join(os.path.dirname(source_model_file(model_file)), "model.onnx")
+    try:
+        import onnxruntime as ort
+
+        st = os.stat(fp32_file)
+    except (ImportError, OSError):
+        return None
+    raw = (
+        f"{os.path.realpath(fp32_file)}|{st.st_size}|{st.st_mtime_ns}|"
+        f"{ort.__version__}|s8-per-channel-matmul"
+    )
+    key = hashlib.sha1(raw.encode("utf-8")).hexdigest()[:16]
+    tag = _cache_source_tag(fp32_file)
+    out_path = os.path.join(_ORT_CACHE_DIR, f"{tag}-{key}.s8.onnx")
+    if os.path.isfile(out_path):
+        return out_path
+    with _requant_lock:
+        if out_path not in _requant_threads:
+            try:
+                os.makedirs(_ORT_CACHE_DIR, exist_ok=True)
+            except OSError:
+                return None
+            thread = threading.Thread(
+                target=_requantize_to_s8,
+                args=(fp32_file, out_path, tag, key),
+                name="int8-requant",
+                daemon=True,
+            )
+            _requant_threads[out_path] = thread
+            thread.start()
+    return None
+
+
+def int8_requant_running() -> bool:
+    """是否有 S8 重新量化正在后台进行（init 据此提示用户）。"""
+    with _requant_lock:
+        return any(thread.is_alive() for thread in _requant_threads.values())
+
+
+def _intra_op_threads(role: str) -> int:
+    default = _default_intra_op_threads(role)
+    try:
+        return max(1, int(os.getenv(f"{role}_INTRA_OP", str(default))))
+    except ValueError:
+        return default
+
+
+def _tune_session_options(sess_options, role: str, model_file):
+    """关闭 CPU 内存 arena（预分配后永不归还，三个会话同时加载时内存近乎翻倍），
+    单线程 inter-op，并禁止 intra-op 线程空转抢占桌面 CPU。
+    固定 batch 等符号维度，避免每种新形状都触发一次分配器/内核重新规划。"""
+    import onnxruntime as ort
+
+    sess_options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+    sess_options.enable_cpu_mem_arena = False
+    sess_options.enable_mem_pattern = True
+    sess_options.inter_op_num_threads = 1
+    sess_options.add_session_config_entry("session.intra_op.allow_spinning", "0")
+    if isinstance(model_file, str):
+        for dim_name, value in _free_dimension_overrides(role, model_file).items():
+            sess_options.add_free_dimension_override_by_name(dim_name, value)
+
+
+def _create_session(orig_create, role, model_file, sess_options=None, providers=None, **kwargs):
+    """替代 funasr_onnx 内部的 InferenceSession 构造：统一会话参数，并复用磁盘上的已优化模型。"""
+    model_file = _requantized_model(model_file, role) or model_file
+    if sess_options is not None:
+        _tune_session_options(sess_options, role, model_file)
+
+    selected = _select_providers(providers, model_file)
+    if selected is not providers:
+        try:
+            # DNNL/OpenVINO 会把子图编译成 EP 专属节点，ORT 无法序列化这类图，不走已优化模型缓存
+            return orig_create(model_file, sess_options=sess_options, providers=selected, **kwargs)
+        except Exception as e:
+            # EP 会话创建失败（驱动/运行库缺失、算子不支持等）时退回默认 CPU EP
+            sys.stderr.write(
+                f"[ORT] {selected[0]} 会话创建失败，回退默认 EP: {type(e).__name__}: {e}\n"
+            )
+            sys.stderr.flush()
+    return _create_cached_session(orig_create, role, model_file, sess_options, providers, **kwargs)
+
+
+def _create_cached_session(orig_create, role, model_file, sess_options, providers, **kwargs):
+    import onnxruntime as ort
+
+    if (
+        sess_options is None
+        or not isinstance(model_file, str)
+        or not os.path.isfile(model_file)
+        # 只有 CPU EP 的优化结果可以落盘复用
+        or any(name != "CPUExecutionProvider" for name in _provider_names(providers))
+    ):
+        return orig_create(model_file, sess_options=sess_options, providers=providers, **kwargs)
+
+    try:
+        key = _optimized_model_key(model_file, role, providers)
+        os.makedirs(_ORT_CACHE_DIR, exist_ok=True)
+    except OSError:
+        return orig_create(model_file, sess_options=sess_options, providers=providers, **kwargs)
+
+    prefix = f"{_cache_source_tag(model_file)}-{key}"
+    opt_path = os.path.join(_ORT_CACHE_DIR, f"{prefix}.opt.onnx")
+    data_name = f"{prefix}.opt.data"
+    if os.path.isfile(opt_path):
+        # 已优化过的图无需再跑一遍图优化；大权重在外部数据文件中按需映射
+        sess_options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_DISABLE_ALL
+        sess_options.optimized_model_filepath = ""
         try:
-            paraformer_bin = _load_funasr_onnx_submodule("paraformer_bin")
-            ContextualParaformer = paraformer_bin.ContextualParaformer
-        except ImportError as e:
-            raise RuntimeError("缺少 funasr_onnx 依赖，请安装 requirements.txt 后重试") from e
+            return orig_create(opt_path, sess_options=sess_options, providers=providers, **kwargs)
+        except Exception:
+            # 缓存损坏或 ORT 不兼容：删除后按原模型重建
+            for path in (opt_path, os.path.join(_ORT_CACHE_DIR, data_name)):
+                with contextlib.suppress(OSError):
+                    os.unlink(path)
+            sess_options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+
+    # 模型与外部数据文件先写到临时目录，会话创建成功后再移入缓存目录，避免中途退出留下半截文件。
+    # 模型内按文件名引用外部数据，两者放在同一目录即可，不受临时目录名影响
+    tmp_dir = os.path.join(_ORT_CACHE_DIR, f"{prefix}.opt.{os.getpid()}.tmp")
+    try:
+        os.makedirs(tmp_dir, exist_ok=True)
+    except OSError:
+        return orig_create(model_file, sess_options=sess_options, providers=providers, **kwargs)
+    sess_options.optimized_model_filepath = os.path.join(tmp_dir, "model.onnx")
+    sess_options.add_session_config_entry(
+        "session.optimized_model_external_initializers_file_name", data_name
+    )
+    sess_options.add_session_config_entry(
+        "session.optimized_model_external_initializers_min_size_in_bytes", "1024"
+    )
+    # 同时把 MatMul/Gemm 等内核预打包后的权重写入外部数据文件：之后加载直接映射，省去每次 init 的重新打包
+    sess_options.add_session_config_entry(
+        "session.save_external_prepacked_constant_initializers", "1"
+    )
+    try:
+        session = orig_create(model_file, sess_options=sess_options, providers=providers, **kwargs)
+    except Exception:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        raise
+    try:
+        # 先移数据文件再移模型：只要 .opt.onnx 存在，它引用的数据文件就已就位
+        tmp_data = os.path.join(tmp_dir, data_name)
+        if os.path.isfile(tmp_data):
+            os.replace(tmp_data, os.path.join(_ORT_CACHE_DIR, data_name))
+        os.replace(sess_options.optimized_model_filepath, opt_path)
+    except OSError:
+        pass
+    else:
+        # 同一源模型旧键（ORT 升级、模型重新下载）留下的缓存不再会命中，删除以免缓存目录无限增长
+        _prune_cache_entries(f"{_cache_source_tag(model_file)}-*.opt.*", f"{prefix}.")
+    finally:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+    return session
+
+
+@contextlib.contextmanager
+def _ort_session_hook(role: str):
+    """在构造 funasr_onnx 模型期间接管其 InferenceSession 创建。"""
+    try:
+        utils_mod = _load_funasr_onnx_submodule("utils.utils")
+    except ImportError:
+        yield
+        return
+    orig_create = getattr(utils_mod, "InferenceSession", None)
+    if orig_create is None:
+        yield
+        return
+
+    def create(model_file, *args, **kwargs):
+        if args:
+            return orig_create(model_file, *args, **kwargs)
+        return _create_session(orig_create, role, model_file, **kwargs)
+
+    utils_mod.InferenceSession = create
+    try:
+        yield
+    finally:
+        utils_mod.InferenceSession = orig_create
+
+
+def _allow_waveform_batches(model):
+    """funasr_onnx 的 load_data 只接受单个 ndarray 或路径列表，补上 ndarray 列表以支持批量推理。"""
+    orig_load_data = getattr(model, "load_data", None)
+    if orig_load_data is None:
+        return
+
+    def load_data(wav_content, fs=None):
+        if isinstance(wav_content, list) and all(
+            isinstance(item, np.ndarray) for item in wav_content
+        ):
+            return list(wav_content)
+        return orig_load_data(wav_content, fs)
+
+    model.load_data = load_data
+
+
+def _memoize_hotword_embedding(model):
+    """热词只在 init 时变化：按热词串缓存 proc_hotword 的分词结果，再按该结果缓存 model_eb 的前向输出，
+    每次识别不再重复分词、重跑热词 embedding 模型。__call__ 只读取这两个结果，不会原地修改。
+    缓存随模型实例保留一份；init 换了热词时按新热词串重新计算。"""
+    orig_proc_hotword = getattr(model, "proc_hotword", None)
+    orig_eb_infer = getattr(model, "eb_infer", None)
+    if orig_proc_hotword is None or orig_eb_infer is None:
+        return
+    # (键, 结果) 整体替换，多个识别线程并发读写时不会读到不匹配的组合
+    proc_entry = (None, None)
+    eb_entry = (None, None)
+
+    def proc_hotword(hotwords):
+        nonlocal proc_entry
+        key, value = proc_entry
+        if key is None or key != hotwords:
+            value = orig_proc_hotword(hotwords)
+            proc_entry = (hotwords, value)
+        return value
+
+    def eb_infer(hotwords, *args, **kwargs):
+        nonlocal eb_entry
+        key, value = eb_entry
+        # proc_hotword 命中缓存时返回的是同一个数组对象；条目持有该数组，按身份比较不会误命中
+        if key is not hotwords:
+            value = orig_eb_infer(hotwords, *args, **kwargs)
+            eb_entry = (hotwords, value)
+        return value
+
+    model.proc_hotword = proc_hotword
+    model.eb_infer = eb_infer
+
+
+def _get_or_create_model(key: tuple, build):
+    with _model_cache_lock:
+        model = _model_cache.get(key)
+        if model is not None:
+            _model_cache.move_to_end(key)
+            return model
+        model = build()
+        if model is not None:
+            _model_cache[key] = model
+            while len(_model_cache) > MAX_CACHED_SESSIONS:
+                _model_cache.popitem(last=False)
+        return model
+
+
+def clear_model_cache():
+    with _model_cache_lock:
+        _model_cache.clear()
+
+
+def resolve_asr_quantize(model_name: str, backend: str, quantize: bool) -> tuple:
+    """按 CPU 是否支持 INT8 点积决定 ASR 实际是否量化，返回 (quantize, 提示信息)；无需调整时提示为空。"""
+    quantize = bool(quantize)
+    # 混合精度后端本身就是指定 INT8 主干，不做调整
+    if not AUTO_INT8 or backend == "funasr_onnx_contextual_mixed":
+        return quantize, ""
+    model_dir = resolve_model_dir(model_name)
+    if not quantize:
+        if not _cpu_has_int8_dot() or not os.path.isfile(os.path.join(model_dir, "model_quant.onnx")):
+            return False, ""
+        return True, "CPU 支持 VNNI/AMX，ASR 自动使用 INT8 量化模型"
+    if _cpu_has_int8_dot():
+        return True, ""
+    fp32_files = ["model.onnx"]
+    if backend in CONTEXTUAL_BACKENDS:
+        fp32_files.append("model_eb.onnx")
+    if not all(os.path.isfile(os.path.join(model_dir, name)) for name in fp32_files):
+        return True, ""
+    return False, "CPU 不支持 VNNI，已关闭 INT8 量化，ASR 改用 FP32 模型"
+
+
+def create_asr_model(model_name: str, backend: str, quantize: bool):
+    return _get_or_create_model(
+        ("ASR", model_name, backend, bool(quantize)),
+        lambda: _build_asr_model(model_name, backend, quantize),
+    )
+
+
+def create_vad_model(model_name: str, backend: str, quantize: bool):
+    if not model_name:
+        return None
+    return _get_or_create_model(
+        ("VAD", model_name, backend, bool(quantize)),
+        lambda: _build_vad_model(model_name, backend, quantize),
+    )
+
+
+def create_punc_model(model_name: str, backend: str):
+    if not model_name:
+        return None
+    return _get_or_create_model(
+        ("PUNC", model_name, backend),
+        lambda: _build_punc_model(model_name, backend),
+    )
+
+
+def _build_asr_model(model_name: str, backend: str, quantize: bool):
+    if backend in ("funasr_onnx_contextual", "funasr_onnx_contextual_mixed"):
+        ContextualParaformer = _funasr_onnx_class("paraformer_bin", "ContextualParaformer")
 
         model_dir = resolve_model_dir(model_name)
+        mixed = backend == "funasr_onnx_contextual_mixed"
         model_dir, effective_quantize = adapt_contextual_quant_model_dir(
-            model_dir, bool(quantize)
-        )
-        model = ContextualParaformer(
-            model_dir=model_dir,
-            quantize=effective_quantize,
-            device_id="-1",
-            intra_op_num_threads=4,
+            model_dir, bool(quantize) or mixed, fp32_embedder=mixed
         )
+        with _ort_session_hook("ASR"):
+            model = ContextualParaformer(
+                model_dir=model_dir,
+                quantize=effective_quantize,
+                device_id="-1",
+                intra_op_num_threads=_intra_op_threads("ASR"),
+            )
         if not hasattr(model, "language"):
             model.language = "zh-cn"
+        _allow_waveform_batches(model)
+        _memoize_hotword_embedding(model)
         return model
 
     if backend == "funasr_onnx_paraformer":
-        try:
-            paraformer_bin = _load_funasr_onnx_submodule("paraformer_bin")
-            Paraformer = paraformer_bin.Paraformer
-        except ImportError as e:
-            raise RuntimeError("缺少 funasr_onnx 依赖，请安装 requirements.txt 后重试") from e
-        return Paraformer(
-            model_dir=resolve_model_dir(model_name),
-            quantize=bool(quantize),
-            device_id="-1",
-            intra_op_num_threads=4,
-        )
+        Paraformer = _funasr_onnx_class("paraformer_bin", "Paraformer")
+        with _ort_session_hook("ASR"):
+            model = Paraformer(
+                model_dir=resolve_model_dir(model_name),
+                quantize=bool(quantize),
+                device_id="-1",
+                intra_op_num_threads=_intra_op_threads("ASR"),
+            )
+        _allow_waveform_batches(model)
+        return model
 
     raise RuntimeError(f"不支持的 ASR backend: {backend}")
 
 
-def create_vad_model(model_name: str, backend: str, quantize: bool):
-    if not model_name:
-        return None
+def _patch_vad_numpy2(cls):
+    """funasr_onnx 的 Fsmn_vad 对 extract_feat 返回的 1 维 feats_len 直接调用 int()，NumPy 2.x 下报错。
+    运行时包装 extract_feat，改为返回 NumPy 标量（仍支持 .max() / .flat / int() 及算术），不改动已安装文件。"""
+    orig = cls.extract_feat
+    if getattr(orig, "_numpy2_compat", False):
+        return cls
+
+    @functools.wraps(orig)
+    def extract_feat(self, *args, **kwargs):
+        feats, feats_len = orig(self, *args, **kwargs)
+        if isinstance(feats_len, np.ndarray) and feats_len.size == 1:
+            feats_len = feats_len.flat[0]
+        return feats, feats_len
+
+    extract_feat._numpy2_compat = True
+    cls.extract_feat = extract_feat
+    return cls
+
+
+def _build_vad_model(model_name: str, backend: str, quantize: bool):
     if backend == "funasr_onnx_vad":
-        try:
-            vad_bin = _load_funasr_onnx_submodule("vad_bin")
-            Fsmn_vad = vad_bin.Fsmn_vad
-        except ImportError as e:
-            raise RuntimeError("缺少 funasr_onnx 依赖，请安装 requirements.txt 后重试") from e
-        return Fsmn_vad(
-            model_dir=resolve_model_dir(model_name),
-            quantize=bool(quantize),
-            device_id="-1",
-            intra_op_num_threads=2,
-        )
+        Fsmn_vad = _patch_vad_numpy2(_funasr_onnx_class("vad_bin", "Fsmn_vad"))
+        with _ort_session_hook("VAD"):
+            return Fsmn_vad(
+                model_dir=resolve_model_dir(model_name),
+                quantize=bool(quantize),
+                device_id="-1",
+                intra_op_num_threads=_intra_op_threads("VAD"),
+            )
 
     raise RuntimeError(f"不支持的 VAD backend: {backend}")
 
 
-def create_punc_model(model_name: str, backend: str):
-    if not model_name:
-        return None
+def _build_punc_model(model_name: str, backend: str):
     if backend == "funasr_onnx_punc":
-        try:
-            punc_bin = _load_funasr_onnx_submodule("punc_bin")
-            CT_Transformer = punc_bin.CT_Transformer
-        except ImportError as e:
-            raise RuntimeError("缺少 funasr_onnx 依赖，请安装 requirements.txt 后重试") from e
+        CT_Transformer = _funasr_onnx_class("punc_bin", "CT_Transformer")
 
-        model_dir = resolve_model_dir(model_name)
-        # 自动检测：若只有 model_quant.onnx 则使用量化版
-        has_plain = os.path.exists(os.path.join(model_dir, "model.onnx"))
-        has_quant = os.path.exists(os.path.join(model_dir, "model_quant.onnx"))
-        quantize = (not has_plain) and has_quant
-
-        return CT_Transformer(
-            model_dir=resolve_model_dir(model_name),
-            quantize=True,
-            device_id="-1",
-            intra_op_num_threads=2,
-        )
+        with _ort_session_hook("PUNC"):
+            return CT_Transformer(
+                model_dir=resolve_model_dir(model_name),
+                # PUNC ONNX 仓库只提供 model_quant.onnx（依赖检查也只校验该文件）
+                quantize=True,
+                device_id="-1",
+                intra_op_num_threads=_intra_op_threads("PUNC"),
+            )
 
     raise RuntimeError(f"不支持的 PUNC backend: {backend}")
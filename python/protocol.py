@@ -1,17 +1,277 @@
-"""JSON 协议工具 — stdin/stdout 通信辅助函数。"""
+"""协议工具 — stdin/stdout 通信辅助函数。
 
-import json
+支持两种线协议：
+  - msgpack（默认）：每帧 = 4 字节大端长度前缀 + MessagePack 负载
+  - json（--json 兼容模式）：每行一个 JSON
+"""
+
+import os
+import queue
+import struct
 import sys
 import threading
 import traceback
+from typing import Callable, Optional, Union
+
+import msgspec
 
 _stdout_lock = threading.Lock()
 
+WIRE_MSGPACK = "msgpack"
+WIRE_JSON = "json"
+
+_wire_format = WIRE_MSGPACK
+# 协议消息写入的原始 stdout 文件描述符（os.write 直写，绕过文本编码与缓冲层）
+_out_fd: Optional[int] = None
+
+_FRAME_HEADER = struct.Struct(">I")
+
+
+# ── 请求消息（按 cmd 字段区分的 tagged union，解码时在 C 层完成字段校验与默认值填充）──
+
+class Request(msgspec.Struct, kw_only=True, tag_field="cmd"):
+    id: int = 0
+
+
+class ModelConfigRequest(Request, kw_only=True):
+    modelName: str
+    backend: str = "funasr_onnx_contextual"
+    quantize: bool = False
+    vadModelName: str = ""
+    vadBackend: str = "funasr_onnx_vad"
+    vadQuantize: bool = True
+    usePunc: bool = True
+    puncModelName: str = ""
+    puncBackend: str = "funasr_onnx_punc"
+
+
+class InitMsg(ModelConfigRequest, kw_only=True, tag="init"):
+    hotwords: str = ""
+    # 短于该采样数的音频跳过 VAD；0 表示始终做 VAD
+    vadMinSamples: int = 24000
+
+
+class CheckMsg(ModelConfigRequest, kw_only=True, tag="check"):
+    pass
+
+
+class PrewarmMsg(ModelConfigRequest, kw_only=True, tag="prewarm"):
+    pass
+
+
+class RecognizeMsg(Request, kw_only=True, tag="recognize"):
+    # msgpack 模式直接携带 WAV 原始字节；JSON 模式由头行 wavBytes 声明、紧随其后的原始字节填入
+    wav: Optional[bytes] = None
+    wavBytes: int = 0
+    # 旧版 JSON 客户端的 base64 音频，仅作兼容
+    wavBase64: Optional[str] = None
+
+
+class DisposeMsg(Request, kw_only=True, tag="dispose"):
+    pass
+
+
+class PingMsg(Request, kw_only=True, tag="ping"):
+    pass
+
+
+Msg = Union[InitMsg, PrewarmMsg, RecognizeMsg, CheckMsg, DisposeMsg, PingMsg]
+REQUEST_COMMANDS = ("init", "prewarm", "recognize", "check", "dispose", "ping")
+
+
+def _enc_hook(obj):
+    # NumPy 标量（如模型输出的 np.float32 / np.int64）按原生 Python 值编码
+    item = getattr(obj, "item", None)
+    if item is not None:
+        return item()
+    raise NotImplementedError(f"无法编码类型 {type(obj).__name__}")
+
+
+encoder = msgspec.msgpack.Encoder(enc_hook=_enc_hook)
+decoder = msgspec.msgpack.Decoder(Msg)
+# 字段校验失败时用于尽量取回 id/cmd，便于按原请求回错
+loose_decoder = msgspec.msgpack.Decoder()
+# JSON 兼容模式同样走 msgspec（输出 UTF-8 原文，等价于 ensure_ascii=False）
+json_encoder = msgspec.json.Encoder(enc_hook=_enc_hook)
+json_decoder = msgspec.json.Decoder(Msg)
+loose_json_decoder = msgspec.json.Decoder()
+
+
+def set_wire_format(fmt: str):
+    """切换线协议，并接管原始 stdout（由独立写线程负责输出）。
+    之后 sys.stdout 指向 stderr，第三方库的 print 输出不会混入协议流。"""
+    global _wire_format, _out_fd, _writer_thread
+    _wire_format = fmt
+    if _out_fd is None:
+        sys.stdout.flush()
+        _out_fd = sys.stdout.fileno()
+        sys.stdout = sys.stderr
+        _writer_thread = threading.Thread(target=_writer_loop, name="stdout-writer", daemon=True)
+        _writer_thread.start()
+
+
+# 写线程一次最多合并的消息数
+_WRITER_BATCH = 32
+# 已编码、待写出的消息；None 为停止信号
+_out_queue: "queue.SimpleQueue[Optional[bytes]]" = queue.SimpleQueue()
+_writer_thread: Optional[threading.Thread] = None
+# stdout 读端已关闭（写线程已退出）：之后的消息直接丢弃，不再入队
+_output_closed = threading.Event()
+_on_output_closed: Optional[Callable[[], None]] = None
+
+
+def _writer_loop():
+    """唯一的 stdout 写入者：生产方（识别线程、下载进度回调等）只入队，不争锁、不因管道写满而阻塞；
+    积压的多条消息合并为一次 os.write。"""
+    while True:
+        data = _out_queue.get()
+        if data is None:
+            return
+        batch = [data]
+        stop = False
+        while len(batch) < _WRITER_BATCH:
+            try:
+                data = _out_queue.get_nowait()
+            except queue.Empty:
+                break
+            if data is None:
+                stop = True
+                break
+            batch.append(data)
+        # 管道写满时可能只写入一部分，循环写完
+        view = memoryview(b"".join(batch))
+        try:
+            while view:
+                written = os.write(_out_fd, view)
+                view = view[written:]
+        except OSError:
+            # 读端（Electron）已关闭，之后的消息无处可写
+            _mark_output_closed()
+            return
+        if stop:
+            return
+
+
+def _mark_output_closed():
+    _output_closed.set()
+    # 丢弃已积压的消息，释放内存
+    while True:
+        try:
+            _out_queue.get_nowait()
+        except queue.Empty:
+            break
+    callback = _on_output_closed
+    if callback is not None:
+        callback()
+
+
+def set_output_closed_handler(callback: Callable[[], None]):
+    """注册 stdout 关闭时的回调（在写线程中调用）；注册时已关闭则立即调用。"""
+    global _on_output_closed
+    _on_output_closed = callback
+    if _output_closed.is_set():
+        callback()
+
+
+def close_output():
+    """等写线程把已入队的消息全部写出后再返回，进程退出前调用。"""
+    if _writer_thread is not None and _writer_thread.is_alive():
+        _out_queue.put(None)
+        _writer_thread.join()
+
+
+def _write(data):
+    if _out_fd is None:
+        with _stdout_lock:
+            sys.stdout.buffer.write(data)
+            sys.stdout.flush()
+        return
+    if not _output_closed.is_set():
+        _out_queue.put(data)
+
 
 def send_json(obj: dict):
-    line = json.dumps(obj, ensure_ascii=False)
-    with _stdout_lock:
-        print(line, flush=True)
+    # 直接编码进可追加缓冲，换行符原地追加，避免 bytes 拼接再拷贝一次整条消息
+    buf = bytearray()
+    json_encoder.encode_into(obj, buf)
+    buf += b"\n"
+    _write(buf)
+
+
+def send_msgpack(obj: dict):
+    # 负载编码到帧头之后的位置，再回填长度，同样免去拼接拷贝
+    buf = bytearray(_FRAME_HEADER.size)
+    encoder.encode_into(obj, buf, _FRAME_HEADER.size)
+    _FRAME_HEADER.pack_into(buf, 0, len(buf) - _FRAME_HEADER.size)
+    _write(buf)
+
+
+def send_msg(obj: dict):
+    """按当前线协议发送一条消息。"""
+    if _wire_format == WIRE_JSON:
+        send_json(obj)
+    else:
+        send_msgpack(obj)
+
+
+_READ_CHUNK = 65536
+
+
+class FdReader:
+    """以 os.read 读取原始 fd，在字节缓冲上直接切出行 / 定长负载 / 长度前缀帧（不经过 Python io 栈）。"""
+
+    def __init__(self, fd: int):
+        self._fd = fd
+        self._buf = bytearray()
+        self._pos = 0
+
+    def _fill(self, need: int = _READ_CHUNK) -> bool:
+        if self._pos:
+            del self._buf[:self._pos]
+            self._pos = 0
+        # 大负载（如整段 WAV）一次读够剩余部分
+        chunk = os.read(self._fd, max(need, _READ_CHUNK))
+        if not chunk:
+            return False
+        self._buf += chunk
+        return True
+
+    def buffered(self) -> bool:
+        """缓冲区中是否还有未消费的数据（再读下一条不会阻塞在 os.read 上）。"""
+        return self._pos < len(self._buf)
+
+    def read_line(self) -> Optional[bytes]:
+        """读取一行（不含换行符）；EOF 时返回残余数据，无数据返回 None。"""
+        while True:
+            nl = self._buf.find(b"\n", self._pos)
+            if nl >= 0:
+                line = bytes(self._buf[self._pos:nl])
+                self._pos = nl + 1
+                return line
+            if not self._fill():
+                if self._pos < len(self._buf):
+                    line = bytes(self._buf[self._pos:])
+                    self._pos = len(self._buf)
+                    return line
+                return None
+
+    def read_exact(self, n: int) -> Optional[bytes]:
+        """读取恰好 n 字节；EOF 前不足 n 字节返回 None。"""
+        while len(self._buf) - self._pos < n:
+            if not self._fill(n - (len(self._buf) - self._pos)):
+                return None
+        with memoryview(self._buf) as mv:
+            data = bytes(mv[self._pos:self._pos + n])
+        self._pos += n
+        return data
+
+    def read_frame(self) -> Optional[bytes]:
+        """读取一帧长度前缀负载；EOF 返回 None。"""
+        header = self.read_exact(_FRAME_HEADER.size)
+        if header is None:
+            return None
+        (length,) = _FRAME_HEADER.unpack(header)
+        return self.read_exact(length)
 
 
 def error_response(
@@ -42,15 +302,18 @@ def error_from_exception(
     phase: str,
     exc: Exception,
     data=None,
+    with_traceback: bool = True,
 ) -> dict:
-    tb = traceback.format_exc()
-    sys.stderr.write(tb)
+    summary = f"{type(exc).__name__}: {exc}"
+    # 可预期的输入类错误（请求解析、WAV 格式）不需要调用栈，省去遍历栈帧与拼接字符串
+    details = traceback.format_exc() if with_traceback else summary + "\n"
+    sys.stderr.write(details)
     sys.stderr.flush()
     return error_response(
         msg_id=msg_id,
         code=code,
-        message=f"{message}: {type(exc).__name__}: {exc}",
+        message=f"{message}: {summary}",
         phase=phase,
-        details=tb,
+        details=details,
         data=data,
     )
@@ -167,6 +167,27 @@ describe('local-asr (sidecar + FunASR)', () => {
     await initPromise
   })
 
+  it('prewarmLocalRecognizer 发送 prewarm（含模型配置、不含热词）后立即返回', async () => {
+    const { prewarmLocalRecognizer } = await import('../../electron/main/local-asr')
+
+    const prewarmPromise = prewarmLocalRecognizer('paraformer-zh-contextual-quant')
+    await new Promise(r => setTimeout(r, 10))
+    mockProc._emit('stdout', '{"ready":true}')
+    await new Promise(r => setTimeout(r, 10))
+    const req = JSON.parse(mockProc.stdin.write.mock.calls[0][0])
+    expect(req.cmd).toBe('prewarm')
+    expect(req.modelName).toBe('iic/speech_paraformer-large-contextual_asr_nat-zh-cn-16k-common-vocab8404-onnx')
+    expect(req.vadModelName).toBe('iic/speech_fsmn_vad_zh-cn-16k-common-onnx')
+    expect(req.puncModelName).toBe('iic/punc_ct-transformer_zh-cn-common-vocab272727-onnx')
+    expect(req.hotwords).toBeUndefined()
+    // 后台下载进度不属于任何等待中的请求，应被忽略
+    mockProc._emit('stdout', JSON.stringify({ id: req.id, ok: true, started: true }))
+    mockProc._emit('stdout', JSON.stringify({ id: req.id, progress: 30 }))
+
+    await prewarmPromise
+    expect(spawnMock).toHaveBeenCalledOnce()
+  })
+
   it('关闭本地 PUNC 后，init/check 请求应跳过 PUNC 模型', async () => {
     const configMod = await import('../../electron/main/config')
     vi.mocked(configMod.getConfig).mockReturnValue({
@@ -197,7 +218,7 @@ describe('local-asr (sidecar + FunASR)', () => {
     await checkPromise
   })
 
-  it('recognizeLocal 发送 wavBase64 并返回识别文本', async () => {
+  it('recognizeLocal 发送 wavBytes 头行 + 原始 WAV 字节并返回识别文本', async () => {
     const { initLocalRecognizer, recognizeLocal } = await import('../../electron/main/local-asr')
 
     // 先初始化
@@ -216,7 +237,9 @@ describe('local-asr (sidecar + FunASR)', () => {
     await new Promise(r => setTimeout(r, 10))
     const recReq = JSON.parse(mockProc.stdin.write.mock.calls[1][0])
     expect(recReq.cmd).toBe('recognize')
-    expect(recReq.wavBase64).toBe(wavBuf.toString('base64'))
+    expect(recReq.wavBytes).toBe(wavBuf.byteLength)
+    expect(recReq.wavBase64).toBeUndefined()
+    expect(mockProc.stdin.write.mock.calls[2][0]).toBe(wavBuf)
     mockProc._emit('stdout', JSON.stringify({ id: recReq.id, ok: true, text: '肉眼所见' }))
 
     const text = await recPromise